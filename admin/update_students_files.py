@@ -10,7 +10,16 @@ PYTHOSHOP_FILE_PATHS_TO_COPY = [
     "__init__.py",
     "pythoshop.kv",
     "pythoshop.py",
+    "pythoshop_colorspace.py",
+    "pythoshop_draw.py",
     "pythoshop_exports.py",
+    "pythoshop_gradient.py",
+    "pythoshop_history.py",
+    "pythoshop_neighborhood.py",
+    "pythoshop_noise.py",
+    "pythoshop_parallel.py",
+    "pythoshop_quantize.py",
+    "pythoshop_transform.py",
     "pythoshop.code-workspace",
 ]
 VSCODE_FILE_PATHS_TO_COPY = [
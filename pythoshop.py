@@ -1,26 +1,89 @@
 import importlib.util
 import math
+import mmap
 import os
+import sys
+import threading
 import time
+import traceback
 import typing
 from io import BytesIO
 
+# Kivy reads sys.argv as soon as it is imported, so our own options have to be taken out first
+PROFILE_STARTUP = "--profile-startup" in sys.argv
+if PROFILE_STARTUP:
+    sys.argv.remove("--profile-startup")
+_startup_times = [("start", time.perf_counter())]
+
+# Kivy's own image loaders (SDL2) handle everything it shows, so keep it from importing Pillow (which is
+# slow) at startup. _get_image_bytes still imports Pillow when an image that isn't a BMP is opened.
+os.environ.setdefault("KIVY_IMAGE", "tex,imageio,dds,sdl2,pygame,ffpy,gif")
+
+if __name__ == "__mp_main__":
+    # multiprocessing runs this file again in each process that runs parallel filters (see
+    # pythoshop_parallel). Those processes only need the filters, so keep Kivy from opening a window
+    os.environ["KIVY_WINDOW"] = "none"
+    os.environ["KIVY_NO_ARGS"] = "1"
+
 from kivy.app import App
+from kivy.clock import Clock, mainthread
 from kivy.core.image import Image as CoreImage
 from kivy.core.window import Window
+from kivy.graphics.texture import Texture
 from kivy.input.providers.mouse import MouseMotionEvent
+from kivy.logger import Logger
 from kivy.uix.button import Button
-from kivy.uix.colorpicker import ColorPicker
 from kivy.uix.dropdown import DropDown
 from kivy.uix.image import Image as UixImage
 from kivy.uix.popup import Popup
+from kivy.uix.textinput import TextInput
 from kivy.uix.widget import Widget
-from PIL import Image
 
-from image_manip import *
+from pythoshop_exports import (
+    MAPPED_IMAGE_MIN_BYTES,
+    BmpHeader,
+    Job,
+    JobCancelled,
+    MappedBmp,
+    WrittenRows,
+    _get_header,
+    get_last_stats,
+    get_pixel_rgb,
+    running_job,
+    watch_writes,
+)
+from pythoshop_history import Change, History, diff, diff_rows
+from pythoshop_transform import resize
 from tests.config import DEFAULT_STARTING_PRIMARY_IMAGE_PATH, DEFAULT_STARTING_SECONDARY_IMAGE_PATH
 
 
+# While dragging the "Select color" tool, the average of this many by this many pixels is used
+COLOR_SAMPLE_SIZE = 5
+# Filters run on images with at least this many pixels first show a preview made from a smaller copy
+PREVIEW_MIN_PIXELS = 1_000_000
+# How often (in seconds) to check whether image_manip.py was saved, so it can be reloaded
+MANIP_RELOAD_INTERVAL = 1.0
+
+
+def _mark_startup(step: str, started: typing.Optional[float] = None) -> None:
+    """
+    Remember that a step of starting up is done (and report how long it took with --profile-startup)
+
+    :param step: What was just done
+    :param started: When the step started (if it didn't start when the previous one finished)
+    :returns: None
+    """
+    now = time.perf_counter()
+    if started is None:
+        started = _startup_times[-1][1]
+    if PROFILE_STARTUP:
+        print(f"Startup: {step} took {now - started:.3f}s (done {now - _startup_times[0][1]:.3f}s after starting)")
+    _startup_times.append((step, now))
+
+
+_mark_startup("imports")
+
+
 class NoImageError(Exception):
     pass
 
@@ -29,12 +92,17 @@ class ImageDisplay:
     def __init__(self, *, is_primary: bool) -> None:
         self.is_primary = is_primary
         self.uix_image: typing.Optional[UixImage] = None
-        self.bytes: typing.Optional[BytesIO] = None
+        self.bytes: typing.Optional[typing.Union[BytesIO, MappedBmp]] = None
+        self.texture: typing.Optional[Texture] = None  # reused for as long as the image stays the same size
+        self.history = History()
 
     def is_image_loaded(self) -> bool:
         return bool(self.uix_image)
 
-    def load_image(self, uix_image: UixImage, bytes_: BytesIO) -> None:
+    def load_image(self, uix_image: UixImage, bytes_: typing.Union[BytesIO, MappedBmp]) -> None:
+        if uix_image is not self.uix_image:  # a different file was opened
+            self.texture = None
+            self.history.clear()
         self.uix_image = uix_image
         self.bytes = bytes_
 
@@ -44,10 +112,83 @@ class ImageDisplay:
         else:
             return PythoShopApp._root.image2
 
-    def do_binds(self) -> None:
+    @staticmethod
+    def _can_blit(image_bytes: typing.Union[BytesIO, MappedBmp]) -> bool:
+        """
+        Whether the pixels can be copied straight into a texture (24 bit and not compressed)
+        """
+        image_bytes.seek(28)
+        bits_per_pixel = int.from_bytes(image_bytes.read(2), "little")
+        compression = int.from_bytes(image_bytes.read(4), "little")
+        header = _get_header(image_bytes)
+        return bits_per_pixel == 24 and compression == 0 and 0 < header.width and 0 < header.height < 2**31
+
+    def _blit(self, image_bytes: typing.Union[BytesIO, MappedBmp], rows: typing.Optional[tuple[int, int]] = None) -> None:
+        """
+        Copy the pixels into the texture (creating it if the image changed
+        size, in which case every row is copied)
+
+        :param image_bytes: The bmp bytes
+        :param rows: (first, last) of the rows that changed, or None to copy every row
+        :returns: None
+        """
         assert self.uix_image
+        header = _get_header(image_bytes)
+        if self.texture is None or tuple(self.texture.size) != (header.width, header.height):
+            self.texture = Texture.create(size=(header.width, header.height), colorfmt="rgb")
+            # to avoid anti-aliassing when zoomed
+            self.texture.mag_filter = "nearest"
+            self.texture.min_filter = "nearest"
+            rows = None
+        first, last = (0, header.height - 1) if rows is None else (max(rows[0], 0), min(rows[1], header.height - 1))
+        if first > last:
+            return
+
+        # Rows are stored bottom first (just like textures) as b, g, r, so they only need the padding left out
+        image_bytes.seek(header.fpp + header.row_size * first)
+        pixels = image_bytes.read(header.row_size * (last + 1 - first))
+        if header.padding:
+            view = memoryview(pixels)
+            row_bytes = header.width * 3
+            pixels = b"".join([view[start : start + row_bytes] for start in range(0, len(pixels), header.row_size)])
+        self.texture.blit_buffer(pixels, size=(header.width, last + 1 - first), pos=(0, first), colorfmt="bgr", bufferfmt="ubyte")
+        if self.uix_image.texture is not self.texture:
+            self.uix_image.texture = self.texture
+        else:
+            self.uix_image.canvas.ask_update()
 
-        self.uix_image.texture = CoreImage(self.bytes, ext="bmp").texture
+    def do_binds(self, rows: typing.Optional[tuple[int, int]] = None) -> None:
+        """
+        Display the image
+
+        :param rows: (first, last) of the only rows that changed since it was last displayed (None if it could be any of them)
+        :returns: None
+        """
+        assert self.bytes
+        self._display(self.bytes, rows)
+
+    def show_preview(self, preview_bytes: BytesIO) -> None:
+        """
+        Display a (smaller) preview of what a filter will do, without changing the image itself.
+        The image is displayed again by the next `do_binds`.
+
+        :param preview_bytes: The bmp bytes of the preview
+        :returns: None
+        """
+        self._display(preview_bytes)
+
+    def _display(self, image_bytes: typing.Union[BytesIO, MappedBmp], rows: typing.Optional[tuple[int, int]] = None) -> None:
+        assert self.uix_image
+
+        if self._can_blit(image_bytes):
+            self._blit(image_bytes, rows)
+            return
+
+        self.texture = None
+        if not isinstance(image_bytes, BytesIO):
+            # Kivy can only decode images that are in a BytesIO
+            image_bytes = BytesIO(image_bytes.getbuffer())
+        self.uix_image.texture = CoreImage(image_bytes, ext="bmp").texture
         # to avoid anti-aliassing when zoomed
         self.uix_image.texture.mag_filter = "nearest"
         self.uix_image.texture.min_filter = "nearest"
@@ -83,12 +224,13 @@ def _set_extra(value: str) -> None:
     PythoShopApp._root.extra_input.text = value
 
 
-def _select_coordinate(x: int, y: int) -> None:
+def _select_coordinate(x: int, y: int, *, dragging: bool = False) -> None:
     """
     Put a given (x, y) coordinate into the `extra parameters...` box
 
     :param x: x value coordinate to set the system to
     :param y: y value coordinate to set the system to
+    :param dragging: Whether the mouse is being dragged (rather than clicked)
     :returns: None
     """
     _set_extra(f"{x}, {y}")
@@ -126,29 +268,63 @@ def _get_current_image() -> ImageDisplay:
         raise NoImageError("Neither image tab was selected (which shouldn't be possible)")
 
 
-def _select_color(x: int, y: int) -> None:  # sourcery skip: merge-else-if-into-elif
+def _average_color(image: typing.Union[BytesIO, MappedBmp], x: int, y: int, size: int) -> tuple[int, int, int]:
+    """
+    Get the average color of the size x size square of pixels around (x, y)
+    (just the part that is inside the image). Only the pixels in the square
+    are read, so it takes the same time no matter how big the image is.
+
+    :param image: The bmp bytes
+    :param x: x coordinate of the middle of the square
+    :param y: y coordinate of the middle of the square
+    :param size: How many pixels wide and tall the square is
+    :returns: The average (r, g, b)
+    """
+    header = _get_header(image)
+    x_start = max(x - size // 2, 0)
+    x_stop = min(x - size // 2 + size, header.width)
+    y_start = max(y - size // 2, 0)
+    y_stop = min(y - size // 2 + size, header.height)
+    totals = [0, 0, 0]  # b, g, r (the order they're stored in)
+    for row in range(y_start, y_stop):
+        image.seek(header.fpp + header.row_size * row + x_start * 3)
+        raw = image.read((x_stop - x_start) * 3)
+        for channel in range(3):
+            totals[channel] += sum(raw[channel::3])
+    num_pixels = (x_stop - x_start) * (y_stop - y_start)
+    return int(totals[2] / num_pixels + 0.5), int(totals[1] / num_pixels + 0.5), int(totals[0] / num_pixels + 0.5)
+
+
+def _select_color(x: int, y: int, *, dragging: bool = False) -> None:
     """
-    Set the color picker to be the RGB of a particular (x, y) coordinate
+    Set the color picker to be the RGB of a particular (x, y) coordinate. While
+    dragging, the average of the pixels around it is used instead.
 
     :param x: The x value of the pixel to sample
     :param y: The y value of the pixel to sample
+    :param dragging: Whether the mouse is being dragged (rather than clicked)
     :returns: None
     """
-    assert PythoShopApp._color_picker
-
     image = _get_current_image()
     if image.bytes:
-        img = Image.open(image.bytes)
-        r, g, b = img.getpixel((x, img.height - 1 - y))
-        PythoShopApp._color_picker.color = (r / 255, g / 255, b / 255, 1)
+        if dragging:
+            r, g, b = _average_color(image.bytes, x, y, COLOR_SAMPLE_SIZE)
+        else:
+            r, g, b = get_pixel_rgb(image.bytes, (x, y))
+        _get_color_picker().color = (r / 255, g / 255, b / 255, 1)
 
 
-def _get_image_bytes(file_name: str) -> BytesIO:
-    if os.path.splitext(file_name)[-1].lower() == ".bmp":
+def _get_image_bytes(file_name: str) -> typing.Union[BytesIO, MappedBmp]:
+    if os.path.splitext(file_name)[-1].lower() == ".bmp" and os.path.getsize(file_name) >= MAPPED_IMAGE_MIN_BYTES:
+        # Huge images are used straight from the file so they don't all have to fit in memory
+        current_bytes = MappedBmp(file_name)
+    elif os.path.splitext(file_name)[-1].lower() == ".bmp":
         # Load it directly rather than going through Pillow where we might loose some fidelity (e.g. paddding bytes)
         current_bytes = BytesIO()
         current_bytes.write(open(file_name, "rb").read())
     else:
+        from PIL import Image  # only loaded when it's needed, as it's slow to import
+
         current_bytes = BytesIO()
         img = Image.open(file_name)
         img = img.convert("RGB")
@@ -158,6 +334,22 @@ def _get_image_bytes(file_name: str) -> BytesIO:
     return current_bytes
 
 
+def _get_color_picker() -> typing.Any:
+    """
+    Get the color picker (it is only created the first time it's needed, as it's slow to create)
+
+    :returns: The ColorPicker
+    """
+    if PythoShopApp._color_picker is None:
+        from kivy.uix.colorpicker import ColorPicker
+
+        PythoShopApp._color_picker = ColorPicker()
+        PythoShopApp._color_picker.children[0].children[1].children[4].disabled = True  # disable the alpha chanel
+        PythoShopApp._color_picker.bind(color=PythoShopApp.on_color)
+        PythoShopApp._color_picker.is_visible = False
+    return PythoShopApp._color_picker
+
+
 def _get_chosen_color() -> tuple[int, int, int]:
     """
     Get currently selected color in RGB format
@@ -196,7 +388,7 @@ def _is_touch_in_image(cimage: UixImage, event: MouseMotionEvent, cscatter) -> b
             return True
 
 
-def _handle_touch_in_image(cimage: UixImage, event: MouseMotionEvent, cscatter) -> None:
+def _get_touch_coordinate(cimage: UixImage, event: MouseMotionEvent, cscatter) -> tuple[int, int]:
     lr_space = (cimage.width - cimage.norm_image_size[0]) / 2  # empty space in Image widget left and right of actual image
     tb_space = (cimage.height - cimage.norm_image_size[1]) / 2  # empty space in Image widget above and below actual image
     pixel_x = event.x - lr_space - cscatter.x  # x coordinate of touch measured from lower left of actual image
@@ -207,12 +399,91 @@ def _handle_touch_in_image(cimage: UixImage, event: MouseMotionEvent, cscatter)
     # scale coordinates to actual pixels of the Image source
     actual_x = int(pixel_x * cimage.texture_size[0] / cimage.norm_image_size[0])
     actual_y = int(pixel_y * cimage.texture_size[1] / cimage.norm_image_size[1])
+    return actual_x, actual_y
+
+
+def _interpolate_coordinates(start: tuple[int, int], end: tuple[int, int]) -> list[tuple[int, int]]:
+    """
+    Get the pixels on a straight line from start to end
+
+    :param start: (x, y) of where the line starts (not included)
+    :param end: (x, y) of where the line ends (included)
+    :returns: The (x, y) of each pixel along the line
+    """
+    steps = max(abs(end[0] - start[0]), abs(end[1] - start[1]))
+    return [
+        (start[0] + round((end[0] - start[0]) * step / steps), start[1] + round((end[1] - start[1]) * step / steps)) for step in range(1, steps + 1)
+    ]
+
+
+def _queue_tool_coordinate(coordinate: tuple[int, int], *, new_stroke: bool) -> None:
+    """
+    Remember a position the tool was used at. The tool is actually run (once
+    for everything that was queued) just before the screen is next drawn.
+
+    :param coordinate: (x, y) of the pixel that was clicked or dragged over
+    :param new_stroke: Whether this is a new click (rather than the mouse being dragged)
+    :returns: None
+    """
+    previous = None if new_stroke else PythoShopApp._last_tool_coordinate
+    if previous is not None and getattr(PythoShopApp._tool_function, "__interpolate__", False):
+        PythoShopApp._queued_coordinates.extend(_interpolate_coordinates(previous, coordinate))
+    else:
+        PythoShopApp._queued_coordinates.append(coordinate)
+    PythoShopApp._last_tool_coordinate = coordinate
+    PythoShopApp._dragging = not new_stroke
+    if PythoShopApp._first_queued_time is None:
+        PythoShopApp._first_queued_time = time.perf_counter()
+        Clock.schedule_once(_run_queued_tool_coordinates)
+
+
+def _run_queued_tool_coordinates(dt: float = 0) -> None:
+    """
+    Run the tool on every position that has been queued (checking and
+    displaying the image only once)
+
+    :param dt: Time since this was scheduled (given by the Clock)
+    :returns: None
+    """
+    coordinates = PythoShopApp._queued_coordinates
+    first_queued_time = PythoShopApp._first_queued_time
+    PythoShopApp._queued_coordinates = []
+    PythoShopApp._first_queued_time = None
+    if not coordinates or PythoShopApp._tool_function is None:
+        return  # e.g. the tool was removed from image_manip.py since these were queued
 
     # Note: can't call your manip functions "_select_"
     if PythoShopApp._tool_function.__name__[:8] == "_select_":
-        PythoShopApp._tool_function(actual_x, actual_y)
+        PythoShopApp._tool_function(*coordinates[-1], dragging=PythoShopApp._dragging)
     else:
-        run_manip_function(PythoShopApp._tool_function, clicked_coordinate=(actual_x, actual_y))
+        run_manip_function(PythoShopApp._tool_function, clicked_coordinates=coordinates)
+    Logger.debug(
+        "PythoShop: ran %s on %d position(s), %.1f ms after the first one",
+        PythoShopApp._tool_function.__name__,
+        len(coordinates),
+        (time.perf_counter() - first_queued_time) * 1000,
+    )
+
+
+def _end_stroke() -> None:
+    """
+    Remember everything the tool changed since the mouse was pressed as one
+    change, so it is undone all at once
+
+    :returns: None
+    """
+    stroke = PythoShopApp._stroke
+    PythoShopApp._stroke = None
+    if stroke is None:
+        return
+    image, image_bytes, written, before = stroke
+    if image.bytes is not image_bytes:
+        return
+    if written.before and not PythoShopApp._stroke_untracked:
+        image.history.add(diff_rows(image_bytes, written.before))
+    else:
+        # The tool wrote bytes itself (so which rows changed isn't known): compare all of the image
+        image.history.add(diff(_contents(before), _contents(image_bytes)))
 
 
 def _write_image_to_file_system(bytes: BytesIO) -> None:
@@ -270,7 +541,12 @@ def _check_bmp_integrity(image: BytesIO) -> None:
     image.seek(0)
 
 
-def run_manip_function(func: typing.Callable, **kwargs) -> None:
+def _get_selected_images() -> tuple[ImageDisplay, ImageDisplay]:
+    """
+    Get the image in the selected tab and the other image
+
+    :returns: (selected image, other image)
+    """
     if _is_primary_tab_selected():
         image1 = PythoShopApp._image1
         image2 = PythoShopApp._image2
@@ -282,35 +558,439 @@ def run_manip_function(func: typing.Callable, **kwargs) -> None:
 
     if not image1.uix_image or not image1.bytes:
         raise NoImageError("The currently selected tab doesn't have an image loaded into it")
+    return image1, image2
 
-    try:
-        image1.bytes.seek(0)
-        kwargs["color"] = _get_chosen_color()
-        kwargs["extra"] = _get_extra_text()
-        if image2.bytes:
-            image2.bytes.seek(0)
-            kwargs["other_image"] = image2.bytes
 
-        result = func(image1.bytes, **kwargs)
+def _call_manip_function(func: typing.Callable, image: typing.Union[BytesIO, MappedBmp], calls: list[dict], **kwargs) -> BytesIO:
+    """
+    Run a filter or tool (possibly several times) and check the image it made.
+    Doesn't touch the GUI, so it can be run in the background.
+
+    :param func: The filter or tool
+    :param image: The bmp bytes to run it on
+    :param calls: Extra keyword arguments for each time it should be run
+    :returns: The resulting image (`image` itself unless the function returned a new one)
+    """
+    verified_bytes = image
+    for call_kwargs in calls:
+        verified_bytes.seek(0)
+        if kwargs.get("other_image"):
+            kwargs["other_image"].seek(0)
+        result = func(verified_bytes, **call_kwargs, **kwargs)
+        stats = get_last_stats()
+        if stats is not None:
+            print(stats.report())
         if result != None:  # Something was returned, make sure it was an image file
             if result.__class__ != BytesIO:
                 raise Exception("Function", func.__name__, "should have returned an image but instead returned something else")
             verified_bytes = result
-        else:  # No return: assume that the change has been made to the image itself (img1)
-            verified_bytes = image1.bytes
+        # No return: assume that the change has been made to the image itself
+
+    try:
+        _check_bmp_integrity(verified_bytes)
+    except AssertionError as ae:
+        raise Exception('The image returned by "' + func.__name__ + '" was corrupt and cannot be displayed: ' + str(ae))
+    verified_bytes.seek(0)
+    return verified_bytes
+
+
+def _set_status(text: str) -> None:
+    PythoShopApp._root.status_label.text = text
 
+
+def _changed_rows(change: typing.Optional[Change], header: BmpHeader) -> typing.Optional[tuple[int, int]]:
+    """
+    Work out which rows of an image a change (from `diff`) is for
+
+    :param change: The change (None if nothing changed)
+    :param header: The header of the image
+    :returns: (first, last) of the changed rows (last is before first if nothing changed), or None if it could be any of them
+    """
+    if change is None:
+        return 0, -1
+    if change.runs is None or not header.row_size or change.runs[0][0] < header.fpp:
+        return None  # the image changed size, or the header changed
+    last_start, last_data = change.runs[-1]
+    return (change.runs[0][0] - header.fpp) // header.row_size, (last_start + len(last_data) - 1 - header.fpp) // header.row_size
+
+
+def _show_job_status(dt: float = 0) -> None:
+    job = PythoShopApp._job
+    if job is None:
+        return
+    text = f"Running {PythoShopApp._job_name}: {time.perf_counter() - PythoShopApp._job_started:.1f}s"
+    progress = job.progress()
+    if progress is not None:
+        text += f" ({progress:.0%})"
+    _set_status(text)
+
+
+def _snapshot(image: typing.Union[BytesIO, MappedBmp]) -> typing.Union[BytesIO, MappedBmp]:
+    """
+    Copy an image for a filter to run on in the background. The copy shares
+    memory with the image until one of them is changed.
+
+    :param image: The bmp bytes
+    :returns: The copy
+    """
+    if isinstance(image, MappedBmp):
+        return image.copy()
+    return BytesIO(image.getvalue())
+
+
+def _contents(image: typing.Union[BytesIO, MappedBmp]) -> typing.Union[bytes, mmap.mmap]:
+    """
+    Get all of an image's bytes to compare (see `diff`) without copying them
+
+    :param image: The bmp bytes
+    :returns: The bytes (or map) of the whole image
+    """
+    if isinstance(image, MappedBmp):
+        return image.getmap()
+    return image.getvalue()
+
+
+def _start_job(func: typing.Callable, image: ImageDisplay, **kwargs) -> None:
+    """
+    Run a filter in the background on a copy of an image. For big images, a
+    preview (see `_make_preview`) is made and shown first. The copy replaces
+    the image once the filter is done (unless it is cancelled).
+
+    :param func: The filter
+    :param image: The image to run it on
+    :returns: None
+    """
+    assert image.bytes
+    original_bytes = image.bytes
+    snapshot = _snapshot(original_bytes)
+    if kwargs.get("other_image"):
+        kwargs["other_image"] = _snapshot(kwargs["other_image"])
+    job = Job(_get_header(snapshot).width * _get_header(snapshot).height)
+    preview_size = _get_preview_size(image) if getattr(func, "__preview__", False) else None
+
+    @mainthread
+    def show_preview(preview_bytes: BytesIO) -> None:
+        if PythoShopApp._job is job and not job.cancelled:
+            image.show_preview(preview_bytes)
+
+    @mainthread
+    def finish(result: typing.Optional[BytesIO], error: typing.Optional[Exception], change: typing.Any = None) -> None:
+        PythoShopApp._job = None
+        PythoShopApp._job_status_event.cancel()
+        PythoShopApp._root.cancel_button.disabled = True
+        seconds = time.perf_counter() - PythoShopApp._job_started
+        if error is not None:
+            _set_status(f"{func.__name__} failed: {error}")
+        elif result is None or job.cancelled:
+            _set_status(f"{func.__name__} was cancelled")
+        elif image.bytes is not original_bytes:
+            _set_status(f"{func.__name__} finished, but a different image was loaded so the result was thrown away")
+        else:
+            image.history.add(change)
+            image.load_image(image.uix_image, result)
+            image.do_binds(_changed_rows(change, _get_header(result)))
+            _set_status(f"{func.__name__} took {seconds:.1f}s")
+            return
+
+        if PythoShopApp._queued_job is not None:
+            # Another filter was picked while this one ran
+            queued_func, queued_image, queued_kwargs = PythoShopApp._queued_job
+            PythoShopApp._queued_job = None
+            _start_job(queued_func, queued_image, **queued_kwargs)
+        elif image.uix_image and image.bytes:
+            image.do_binds()  # in case a preview was showing
+
+    def work() -> None:
         try:
-            _check_bmp_integrity(verified_bytes)
-        except AssertionError as ae:
-            raise Exception('The image returned by "' + func.__name__ + '" was corrupt and cannot be displayed: ' + str(ae))
+            with running_job(job):
+                if preview_size is not None:
+                    # Something to look at while the real result is worked out (cancelling the job stops this too)
+                    total_pixels, job.total_pixels = job.total_pixels, 0  # the preview doesn't count towards the progress
+                    preview_bytes = _make_preview(func, snapshot, preview_size, **kwargs)
+                    job.total_pixels, job.pixels_written = total_pixels, 0
+                    if preview_bytes is not None:
+                        show_preview(preview_bytes)
+                result = _call_manip_function(func, snapshot, [{}], **kwargs)
+        except JobCancelled:
+            finish(None, None)
+        except Exception as e:
+            traceback.print_exc()
+            finish(None, e)
+        else:
+            finish(result, None, diff(_contents(original_bytes), _contents(result)))
 
-        verified_bytes.seek(0)
-        image1.load_image(image1.uix_image, verified_bytes)
-        image1.do_binds()
+    PythoShopApp._job = job
+    PythoShopApp._job_name = func.__name__
+    PythoShopApp._job_started = time.perf_counter()
+    PythoShopApp._job_status_event = Clock.schedule_interval(_show_job_status, 0.1)
+    PythoShopApp._root.cancel_button.disabled = False
+    _show_job_status()
+    threading.Thread(target=work, daemon=True).start()
+
+
+def _get_preview_size(image: ImageDisplay) -> typing.Optional[tuple[int, int]]:
+    """
+    Work out how big a preview of an image needs to be to look the same on screen
+
+    :param image: The image
+    :returns: (width, height) of the preview, or None if the image isn't big enough to need one
+    """
+    assert image.uix_image and image.bytes
+    if not image._can_blit(image.bytes):
+        return None
+    header = _get_header(image.bytes)
+    shown_width, shown_height = image.uix_image.norm_image_size
+    scale = min(shown_width / header.width, shown_height / header.height)
+    if header.width * header.height < PREVIEW_MIN_PIXELS or not 0 < scale < 1:
+        return None
+    return max(round(header.width * scale), 1), max(round(header.height * scale), 1)
+
+
+def _make_preview(
+    func: typing.Callable, image_bytes: typing.Union[BytesIO, MappedBmp], size: tuple[int, int], **kwargs
+) -> typing.Optional[BytesIO]:
+    """
+    Run a filter on a copy of an image that is only as big as it is on
+    screen. Doesn't touch the GUI, so it can be run in the background.
+
+    :param func: The filter
+    :param image_bytes: The bmp bytes to make the preview from
+    :param size: (width, height) of the preview (see `_get_preview_size`)
+    :returns: The preview (or None if the filter failed on it)
+    """
+    header = _get_header(image_bytes)
+    other_image = kwargs.get("other_image")
+    try:
+        if other_image:
+            # Shrink the secondary image just as much, so the two still line up
+            other_header = _get_header(other_image)
+            other_width = max(other_header.width * size[0] // header.width, 1)
+            other_height = max(other_header.height * size[1] // header.height, 1)
+            kwargs["other_image"] = resize(other_image, other_width, other_height)
+        return _call_manip_function(func, resize(image_bytes, *size), [{}], **kwargs)
+    except Exception:
+        traceback.print_exc()  # no preview, but the real run will say what went wrong
+        return None
+
+
+def run_manip_function(func: typing.Callable, clicked_coordinates: typing.Optional[list[tuple[int, int]]] = None, **kwargs) -> None:
+    """
+    Run a filter or tool on the image in the selected tab and display the
+    result. Filters run in the background (big images show a quick preview
+    first); tools run straight away.
+
+    :param func: The filter or tool
+    :param clicked_coordinates: For tools, every (x, y) the tool was used at since the last run
+    :returns: None
+    """
+    image1, image2 = _get_selected_images()
+    if PythoShopApp._job is not None and clicked_coordinates is not None:
+        _set_status(f"Wait for {PythoShopApp._job_name} to finish (or cancel it)")
+        return
+
+    try:
+        kwargs["color"] = _get_chosen_color()
+        kwargs["extra"] = _get_extra_text()
+        if image2.bytes:
+            kwargs["other_image"] = image2.bytes
+
+        if clicked_coordinates is None:
+            _end_stroke()
+            if PythoShopApp._job is not None:
+                # The running filter's result is no longer wanted: this one runs as soon as it stops
+                PythoShopApp._job.cancel()
+                PythoShopApp._queued_job = (func, image1, kwargs)
+                _set_status(f"Cancelling {PythoShopApp._job_name} to run {func.__name__}...")
+            else:
+                _start_job(func, image1, **kwargs)
+            return
+        elif getattr(func, "__batch__", False):
+            calls = [{"clicked_coordinate": clicked_coordinates[-1], "clicked_coordinates": clicked_coordinates}]
+        else:
+            calls = [{"clicked_coordinate": coordinate} for coordinate in clicked_coordinates]
+
+        original_bytes = image1.bytes
+        stroke = PythoShopApp._stroke
+        if stroke is None or stroke[0] is not image1 or stroke[1] is not original_bytes:
+            _end_stroke()
+            # The copy shares memory with the image until the tool first writes to it
+            PythoShopApp._stroke = (image1, original_bytes, WrittenRows(), _snapshot(original_bytes))
+            PythoShopApp._stroke_untracked = False
+        with watch_writes(original_bytes, PythoShopApp._stroke[2]) as written:
+            verified_bytes = _call_manip_function(func, original_bytes, calls, **kwargs)
+        if verified_bytes is not original_bytes:
+            # A new image (e.g. a different size), so remember all of the old one as it was before the stroke
+            before = PythoShopApp._stroke[3]
+            PythoShopApp._stroke = None
+            image1.history.add(Change(snapshot=_contents(before)[:]))
+            image1.load_image(image1.uix_image, verified_bytes)
+            image1.do_binds()
+        else:
+            # Only the rows the pixel helpers wrote need showing again (all of them if the tool wrote bytes itself)
+            rows = written.take_span()
+            if rows is None:
+                PythoShopApp._stroke_untracked = True
+            image1.do_binds(rows)
     except SyntaxError:
         print("Error: ", func.__name__, "generated an exception")
 
 
+def _get_manip_path() -> str:
+    return os.getcwd() + "/image_manip.py"
+
+
+def _load_manip_functions(file_path: str) -> dict[str, typing.Callable]:
+    """
+    Run image_manip.py (as a brand new module) and find its filters and tools.
+    Doesn't touch the GUI, so it can be run in the background.
+
+    :param file_path: Where image_manip.py is
+    :returns: The name of each @export_filter/@export_tool function -> the function
+    """
+    spec = importlib.util.spec_from_file_location("image_manip", file_path)
+    manip_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(manip_module)  # try to load it to see if we have a syntax error
+    functions = {}
+    for attribute in dir(manip_module):
+        thing = getattr(manip_module, attribute)
+        if callable(thing) and hasattr(thing, "__wrapped__") and hasattr(thing, "__type__"):
+            if getattr(thing, "__type__") in ("filter", "tool"):
+                functions[attribute] = thing
+            else:
+                print("Error: unrecognized manipulation")
+    return functions
+
+
+def _add_function_button(name: str, func: typing.Callable) -> None:
+    """
+    Add a button for a filter or tool to its dropdown (keeping them in alphabetical order)
+
+    :param name: The name of the function
+    :param func: The filter or tool
+    :returns: None
+    """
+    dropdown = PythoShopApp._filter_dropdown if func.__type__ == "filter" else PythoShopApp._tool_dropdown
+    btn = Button(text=name, size_hint_y=None, height=44)
+    btn.func = func
+    btn.bind(on_release=lambda btn: dropdown.select(btn))
+
+    shown = list(reversed(dropdown.container.children))  # kivy keeps the last one shown first
+    position = len(shown)
+    for i, other in enumerate(shown):
+        if other.text > name and other in PythoShopApp._function_buttons.values():  # the selection tools always come first
+            position = i
+            break
+    dropdown.add_widget(btn, len(shown) - position)
+    PythoShopApp._function_buttons[name] = btn
+
+
+def _update_function_buttons(functions: dict[str, typing.Callable]) -> None:
+    """
+    Make the dropdowns match the functions of a (re)loaded image_manip.py.
+    Only buttons for functions that were added, removed or changed between
+    filter and tool are added or removed; the others just get the new
+    version of their function. The selected tool stays selected.
+
+    :param functions: The name of each filter and tool -> the function
+    :returns: None
+    """
+    for name, btn in list(PythoShopApp._function_buttons.items()):
+        if name not in functions or functions[name].__type__ != btn.func.__type__:
+            btn.parent.remove_widget(btn)
+            del PythoShopApp._function_buttons[name]
+    for name, func in functions.items():
+        if name in PythoShopApp._function_buttons:
+            PythoShopApp._function_buttons[name].func = func
+        else:
+            _add_function_button(name, func)
+
+    if PythoShopApp._tool_function is not None and PythoShopApp._tool_function not in (_select_coordinate, _select_color):
+        btn = PythoShopApp._function_buttons.get(PythoShopApp._root.tool_button.text)
+        if btn is not None and btn.func.__type__ == "tool":
+            PythoShopApp._tool_function = btn.func
+        else:
+            PythoShopApp._tool_function = None  # it's gone
+            PythoShopApp._root.tool_button.text = "Select a tool"
+            PythoShopApp._queued_coordinates = []  # nothing left to run them with
+            _end_stroke()
+
+
+def _check_manip_file(dt: float = 0) -> None:
+    """
+    Reload image_manip.py (in the background) if it was saved since it was last loaded
+    """
+    file_path = _get_manip_path()
+    try:
+        modified = os.stat(file_path).st_mtime_ns
+    except OSError:
+        return
+    if modified == PythoShopApp._manip_modified or PythoShopApp._manip_reloading:
+        return
+    PythoShopApp._manip_modified = modified
+    PythoShopApp._manip_reloading = True
+
+    @mainthread
+    def finish(functions: typing.Optional[dict[str, typing.Callable]], error: typing.Optional[Exception]) -> None:
+        PythoShopApp._manip_reloading = False
+        if isinstance(error, SyntaxError):
+            print("Error: ImageManip.py has a syntax error and can't be executed")
+            _set_status(f"image_manip.py has a syntax error (line {error.lineno}): {error.msg}")
+        elif error is not None:
+            _set_status(f"image_manip.py could not be reloaded: {error}")
+        else:
+            assert functions is not None
+            _update_function_buttons(functions)
+            _set_status("Loaded image_manip.py")
+
+    def load() -> None:
+        try:
+            functions = _load_manip_functions(file_path)
+        except SyntaxError as e:
+            finish(None, e)
+        except Exception as e:
+            traceback.print_exc()
+            finish(None, e)
+        else:
+            finish(functions, None)
+
+    threading.Thread(target=load, daemon=True).start()
+
+
+def _load_default_image(image: ImageDisplay, file_name: str) -> None:
+    """
+    Load one of the starting images in the background and display it once
+    it's ready (unless the user has already opened another image)
+
+    :param image: Where to display it
+    :param file_name: The image file
+    :returns: None
+    """
+
+    started = time.perf_counter()
+
+    @mainthread
+    def show(current_bytes: typing.Union[BytesIO, MappedBmp]) -> None:
+        if image.uix_image is not None:
+            return
+        # Create a Kivy Image widget for the loaded image
+        uix_image = UixImage(fit_mode="contain")
+        image.load_image(uix_image, current_bytes)
+        image.do_binds()
+        image.do_resize()
+        _mark_startup("loading " + os.path.basename(file_name), started)
+
+    def load() -> None:
+        try:
+            current_bytes = _get_image_bytes(file_name)
+        except Exception:
+            traceback.print_exc()
+            return
+        current_bytes.seek(0)
+        show(current_bytes)
+
+    threading.Thread(target=load, daemon=True).start()
+
+
 class FileChooserDialog(Widget):
     def __init__(self, **kwargs) -> None:
         super().__init__()
@@ -342,13 +1022,14 @@ class PhotoShopWidget(Widget):
     _file_chooser_popup = None
 
     def toggle_color(self) -> None:
-        if PythoShopApp._color_picker.is_visible:
-            PythoShopApp._root.children[0].remove_widget(PythoShopApp._color_picker)
-            PythoShopApp._color_picker.is_visible = False
+        color_picker = _get_color_picker()
+        if color_picker.is_visible:
+            PythoShopApp._root.children[0].remove_widget(color_picker)
+            color_picker.is_visible = False
             PythoShopApp._root.color_button.text = "Change Color"
         else:
-            PythoShopApp._root.children[0].add_widget(PythoShopApp._color_picker)
-            PythoShopApp._color_picker.is_visible = True
+            PythoShopApp._root.children[0].add_widget(color_picker)
+            color_picker.is_visible = True
             PythoShopApp._root.color_button.text = "Set Color"
 
     def load_image(self) -> None:
@@ -361,30 +1042,89 @@ class PhotoShopWidget(Widget):
         if image.bytes:
             _write_image_to_file_system(image.bytes)
 
-    def apply_tool(self, event: MouseMotionEvent, callback: typing.Callable) -> bool:
+    def apply_tool(self, event: MouseMotionEvent, callback: typing.Callable, *, new_stroke: bool = False) -> bool:
         image = _get_current_image()
 
         uix_image = image.uix_image
         scatter = image.get_scatter()
         if uix_image and PythoShopApp._tool_function and _is_touch_in_image(uix_image, event, scatter):
-            _handle_touch_in_image(uix_image, event, scatter)
+            if PythoShopApp._job is not None:
+                return True  # the image is about to be replaced, so don't change it
+            if new_stroke:
+                _end_stroke()  # in case the mouse was let go of somewhere it wasn't noticed
+            _queue_tool_coordinate(_get_touch_coordinate(uix_image, event, scatter), new_stroke=new_stroke)
+            if new_stroke:
+                _run_queued_tool_coordinates()  # clicks are shown straight away; drags once per frame
             return True
         else:
             return callback(event)
 
+    def undo(self) -> None:
+        self._step_history(redo=False)
+
+    def redo(self) -> None:
+        self._step_history(redo=True)
+
+    def _step_history(self, *, redo: bool) -> None:
+        image = _get_current_image()
+        if not image.bytes:
+            return
+        if PythoShopApp._job is not None:
+            _set_status(f"Wait for {PythoShopApp._job_name} to finish (or cancel it)")
+            return
+        _end_stroke()
+        if redo and image.history.can_redo():
+            change = image.history.redo_changes[-1]
+            image.load_image(image.uix_image, image.history.redo(image.bytes))
+        elif not redo and image.history.can_undo():
+            change = image.history.undo_changes[-1]
+            image.load_image(image.uix_image, image.history.undo(image.bytes))
+        else:
+            _set_status("Nothing to " + ("redo" if redo else "undo"))
+            return
+        image.do_binds(_changed_rows(change, _get_header(image.bytes)))
+        _set_status("")
+
+    def cancel_job(self) -> None:
+        PythoShopApp._queued_job = None
+        if PythoShopApp._job is not None:
+            PythoShopApp._job.cancel()
+            _set_status(f"Cancelling {PythoShopApp._job_name}...")
+
     def on_touch_down(self, touch: MouseMotionEvent) -> None:
-        self.apply_tool(touch, super().on_touch_down)
+        self.apply_tool(touch, super().on_touch_down, new_stroke=True)
 
     def on_touch_move(self, movement: MouseMotionEvent) -> None:
         self.apply_tool(movement, super().on_touch_move)
 
+    def on_touch_up(self, touch: MouseMotionEvent) -> bool:
+        if PythoShopApp._stroke is not None:
+            _run_queued_tool_coordinates()  # the end of the drag belongs to the same change
+            _end_stroke()
+        return super().on_touch_up(touch)
+
 
 class PythoShopApp(App):
     _image1: ImageDisplay = ImageDisplay(is_primary=True)
     _image2: ImageDisplay = ImageDisplay(is_primary=False)
     _root: typing.Any = None
     _tool_function: typing.Any = None
-    _color_picker: typing.Optional[ColorPicker] = None
+    _queued_coordinates: list[tuple[int, int]] = []  # where the tool has been used since it was last run
+    _first_queued_time: typing.Optional[float] = None
+    _last_tool_coordinate: typing.Optional[tuple[int, int]] = None  # for filling in the gaps of fast drags
+    _dragging = False  # whether the queued positions came from dragging the mouse
+    # The image the tool is changing, the rows it changed since the mouse was pressed, and a copy from before then
+    _stroke: typing.Optional[tuple[ImageDisplay, typing.Union[BytesIO, MappedBmp], WrittenRows, typing.Union[BytesIO, MappedBmp]]] = None
+    _stroke_untracked = False  # whether part of the stroke wrote bytes without the pixel helpers
+    _job: typing.Optional[Job] = None  # the filter running in the background
+    _job_name = ""
+    _job_started = 0.0
+    _job_status_event: typing.Any = None
+    _queued_job: typing.Optional[tuple[typing.Callable, ImageDisplay, dict]] = None  # the filter to run once the cancelled one stops
+    _function_buttons: dict[str, Button] = {}  # the dropdown button of each filter and tool in image_manip.py
+    _manip_modified = 0  # when image_manip.py was last changed (as of when it was last loaded)
+    _manip_reloading = False
+    _color_picker: typing.Any = None  # see _get_color_picker
     _first_color = True
 
     def on_color(self, value: list[int]) -> None:
@@ -411,86 +1151,66 @@ class PythoShopApp(App):
     def _on_file_drop(self, window, file_path: str) -> None:
         PythoShopApp._root.extra_input.text = file_path
 
+    def _on_key_down(self, window, key: int, scancode: int, codepoint: typing.Optional[str], modifiers: list[str]) -> bool:
+        if not ("ctrl" in modifiers or "meta" in modifiers) or codepoint not in ("z", "y"):
+            return False
+        if any(isinstance(widget, TextInput) and widget.focus for child in window.children for widget in child.walk()):
+            return False  # let the text being typed have its own undo
+        if (codepoint == "z" and "shift" in modifiers) or codepoint == "y":
+            PythoShopApp._root.redo()
+        else:
+            PythoShopApp._root.undo()
+        return True
+
     def build(self) -> None:
+        _mark_startup("starting kivy")
         Window.bind(on_dropfile=self._on_file_drop)
+        Window.bind(on_key_down=self._on_key_down)
         PythoShopApp._root = PhotoShopWidget()
-        # Find the functions that can be run
-        try:
-            PythoShopApp._filter_dropdown = DropDown()
-            PythoShopApp._tool_dropdown = DropDown()
-            PythoShopApp._color_dropdown = DropDown()
-            PythoShopApp._color_picker = ColorPicker()
-            PythoShopApp._color_picker.children[0].children[1].children[4].disabled = True  # disable the alpha chanel
-            PythoShopApp._color_picker.bind(color=PythoShopApp.on_color)
-            PythoShopApp._color_picker.is_visible = False
-
-            # Selection tools come first
-            select_coord_button = Button(text="Select coordinate", size_hint_y=None, height=44)
-            select_coord_button.func = _select_coordinate
-            select_coord_button.bind(on_release=lambda btn: PythoShopApp._tool_dropdown.select(btn))
-            PythoShopApp._tool_dropdown.add_widget(select_coord_button)
-            select_color_button = Button(text="Select color", size_hint_y=None, height=44)
-            select_color_button.func = _select_color
-            select_color_button.bind(on_release=lambda btn: PythoShopApp._tool_dropdown.select(btn))
-            PythoShopApp._tool_dropdown.add_widget(select_color_button)
-
-            spec = importlib.util.spec_from_file_location("image_manip", os.getcwd() + "/image_manip.py")
-            manip_module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(manip_module)  # try to load it to see if we have a syntax error
-            for attribute in dir(manip_module):
-                thing = getattr(manip_module, attribute)
-                if callable(thing) and hasattr(thing, "__wrapped__") and hasattr(thing, "__type__"):
-                    if getattr(thing, "__type__") == "filter":
-                        btn = Button(text=attribute, size_hint_y=None, height=44)
-                        btn.func = thing
-                        btn.bind(on_release=lambda btn: PythoShopApp._filter_dropdown.select(btn))
-                        PythoShopApp._filter_dropdown.add_widget(btn)
-                    elif getattr(thing, "__type__") == "tool":
-                        btn = Button(text=attribute, size_hint_y=None, height=44)
-                        btn.func = thing
-                        btn.bind(on_release=lambda btn: PythoShopApp._tool_dropdown.select(btn))
-                        PythoShopApp._tool_dropdown.add_widget(btn)
-                    else:
-                        print("Error: unrecognized manipulation")
-            PythoShopApp._root.filter_button.bind(on_release=PythoShopApp._filter_dropdown.open)
-            PythoShopApp._root.tool_button.bind(on_release=PythoShopApp._tool_dropdown.open)
-
-            def select_filter(self, btn):
-                # currently selected tab actually has an image
-                image = _get_current_image()
-                if image.is_image_loaded():
-                    run_manip_function(btn.func)
-
-            PythoShopApp._filter_dropdown.bind(on_select=select_filter)
-
-            def select_tool(self, btn):
-                setattr(PythoShopApp._root.tool_button, "text", btn.text)
-                PythoShopApp._tool_function = btn.func
-
-            PythoShopApp._tool_dropdown.bind(on_select=select_tool)
-        except SyntaxError:
-            print("Error: ImageManip.py has a syntax error and can't be executed")
-
+        PythoShopApp._filter_dropdown = DropDown()
+        PythoShopApp._tool_dropdown = DropDown()
+        PythoShopApp._color_dropdown = DropDown()
+
+        # Selection tools come first
+        select_coord_button = Button(text="Select coordinate", size_hint_y=None, height=44)
+        select_coord_button.func = _select_coordinate
+        select_coord_button.bind(on_release=lambda btn: PythoShopApp._tool_dropdown.select(btn))
+        PythoShopApp._tool_dropdown.add_widget(select_coord_button)
+        select_color_button = Button(text="Select color", size_hint_y=None, height=44)
+        select_color_button.func = _select_color
+        select_color_button.bind(on_release=lambda btn: PythoShopApp._tool_dropdown.select(btn))
+        PythoShopApp._tool_dropdown.add_widget(select_color_button)
+
+        PythoShopApp._root.filter_button.bind(on_release=PythoShopApp._filter_dropdown.open)
+        PythoShopApp._root.tool_button.bind(on_release=PythoShopApp._tool_dropdown.open)
+
+        def select_filter(self, btn):
+            # currently selected tab actually has an image
+            image = _get_current_image()
+            if image.is_image_loaded():
+                run_manip_function(btn.func)
+
+        PythoShopApp._filter_dropdown.bind(on_select=select_filter)
+
+        def select_tool(self, btn):
+            setattr(PythoShopApp._root.tool_button, "text", btn.text)
+            PythoShopApp._tool_function = btn.func
+
+        PythoShopApp._tool_dropdown.bind(on_select=select_tool)
+
+        # Find the functions that can be run (in the background, like when image_manip.py is changed later)
+        _check_manip_file()
+        Clock.schedule_interval(_check_manip_file, MANIP_RELOAD_INTERVAL)
+
+        # Images show up as soon as they're loaded, rather than holding up the window
         if os.path.exists(DEFAULT_STARTING_PRIMARY_IMAGE_PATH):
-            current_bytes = _get_image_bytes(DEFAULT_STARTING_PRIMARY_IMAGE_PATH)
-            current_bytes.seek(0)
-
-            # Create a Kivy Image widget for the loaded image
-            uix_image = UixImage(fit_mode="contain")
-            PythoShopApp._image1.load_image(uix_image, current_bytes)
-            PythoShopApp._image1.do_binds()
-            PythoShopApp._image1.do_resize()
-
+            _load_default_image(PythoShopApp._image1, DEFAULT_STARTING_PRIMARY_IMAGE_PATH)
         if os.path.exists(DEFAULT_STARTING_SECONDARY_IMAGE_PATH):
-            current_bytes = _get_image_bytes(DEFAULT_STARTING_SECONDARY_IMAGE_PATH)
-            current_bytes.seek(0)
-
-            # Create a Kivy Image widget for the loaded image
-            uix_image = UixImage(fit_mode="contain")
-            PythoShopApp._image2.load_image(uix_image, current_bytes)
-            PythoShopApp._image2.do_binds()
-            PythoShopApp._image2.do_resize()
+            _load_default_image(PythoShopApp._image2, DEFAULT_STARTING_SECONDARY_IMAGE_PATH)
 
+        _mark_startup("build")
+        built = time.perf_counter()
+        Clock.schedule_once(lambda dt: _mark_startup("first frame", built))
         return PythoShopApp._root
 
 
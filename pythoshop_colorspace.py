@@ -0,0 +1,153 @@
+"""PythoShop Colorspace
+
+Fast helpers for filters that work with hue, saturation and value (HSV) or
+hue, saturation and lightness (HSL) instead of red, green and blue. A whole
+image is turned into three "planes" (one list of 0-1 numbers for each
+part, with a number for every pixel) and back again.
+
+Every different color is only converted once (photos usually have far
+fewer colors than pixels), so something like "make everything more
+saturated" is one list expression plus a cheap conversion back:
+
+    hues, saturations, values = to_planes(image)
+    saturations = [min(s * 1.5, 1.0) for s in saturations]
+    from_planes(image, (hues, saturations, values))
+"""
+
+import colorsys
+import io
+import itertools
+import operator
+import typing
+
+from pythoshop_exports import _get_header, _pixel_spans, _read_pixel_area, _write_pixel_area, map_colors
+
+Color = tuple[int, int, int]
+Planes = tuple[list[float], list[float], list[float]]
+
+
+def _hsl_from_rgb(r: float, g: float, b: float) -> tuple[float, float, float]:
+    h, l, s = colorsys.rgb_to_hls(r, g, b)
+    return h, s, l
+
+
+def _rgb_from_hsl(h: float, s: float, l: float) -> tuple[float, float, float]:
+    return colorsys.hls_to_rgb(h, l, s)
+
+
+# Space name -> (conversion from r, g, b, conversion back to r, g, b); everything is 0 to 1
+_SPACES: dict[str, tuple[typing.Callable, typing.Callable]] = {
+    "hsv": (colorsys.rgb_to_hsv, colorsys.hsv_to_rgb),
+    "hsl": (_hsl_from_rgb, _rgb_from_hsl),
+}
+
+
+def _get_space(space: str) -> tuple[typing.Callable, typing.Callable]:
+    if space not in _SPACES:
+        raise ValueError('"' + space + '" is not a color space. Try one of: ' + ", ".join(_SPACES))
+    return _SPACES[space]
+
+
+def _to_byte(value: float) -> int:
+    return int(value * 255 + 0.5)
+
+
+def _read_colors(image: io.BytesIO) -> list[Color]:
+    """
+    Helper function to get the (r, g, b) of every pixel in the order they are stored
+
+    :param image: The bmp bytes
+    :returns: The colors (bottom row first, left to right)
+    """
+    pixels = _read_pixel_area(image)
+    colors: list[Color] = []
+    for start, stop in _pixel_spans(_get_header(image)):
+        colors.extend(zip(pixels[start + 2 : stop : 3], pixels[start + 1 : stop : 3], pixels[start:stop:3]))
+    return colors
+
+
+def to_planes(image: io.BytesIO, space: str = "hsv") -> Planes:
+    """
+    Get the hue, saturation and value (or lightness) of every pixel
+
+    :param image: The bmp bytes
+    :param space: "hsv" or "hsl"
+    :returns: (hues, saturations, values/lightnesses), each a list of 0-1 numbers with one for each pixel
+    """
+    from_rgb, _ = _get_space(space)
+    colors = _read_colors(image)
+    converted = {color: from_rgb(color[0] / 255, color[1] / 255, color[2] / 255) for color in set(colors)}
+    first, second, third = zip(*map(converted.__getitem__, colors)) if colors else ((), (), ())
+    return list(first), list(second), list(third)
+
+
+def from_planes(image: io.BytesIO, planes: Planes, space: str = "hsv") -> None:
+    """
+    Change every pixel of an image to the color described by planes made by
+    (and perhaps changed after) `to_planes`
+
+    :param image: The bmp bytes
+    :param planes: (hues, saturations, values/lightnesses), each a list of 0-1 numbers with one for each pixel
+    :param space: "hsv" or "hsl"
+    :returns: None
+    """
+    _, to_rgb = _get_space(space)
+    header = _get_header(image)
+    if any(len(plane) != header.width * header.height for plane in planes):
+        raise ValueError("each plane needs one number for each pixel")
+    converted: dict[tuple[float, float, float], bytes] = {}  # (h, s, v) -> new bytes (in the order they're stored)
+    pixels = _read_pixel_area(image)
+    spans = _pixel_spans(header)
+    pixels_per_span = (spans[0][1] - spans[0][0]) // 3
+    for span, (start, stop) in enumerate(spans):
+        first = span * pixels_per_span
+        colors = list(zip(*(plane[first : first + pixels_per_span] for plane in planes)))
+        for color in set(colors).difference(converted):
+            r, g, b = to_rgb(*color)
+            converted[color] = bytes((_to_byte(b), _to_byte(g), _to_byte(r)))
+        pixels[start:stop] = b"".join(map(converted.__getitem__, colors))
+    _write_pixel_area(image, pixels)
+
+
+def adjust_planes(planes: Planes, hue_shift: float = 0.0, saturation_scale: float = 1.0, value_scale: float = 1.0) -> Planes:
+    """
+    Get new planes with the hue turned and the saturation and value (or
+    lightness) made bigger or smaller. Results are kept between 0 and 1.
+
+    :param planes: (hues, saturations, values/lightnesses) made by `to_planes`
+    :param hue_shift: How far to turn the hue (1 is all the way around the color wheel)
+    :param saturation_scale: What to multiply the saturation by
+    :param value_scale: What to multiply the value (or lightness) by
+    :returns: The new planes
+    """
+    hues, saturations, values = planes
+    if hue_shift:
+        hues = list(map(operator.mod, map(operator.add, hues, itertools.repeat(hue_shift)), itertools.repeat(1.0)))
+    if saturation_scale != 1:
+        saturations = list(map(min, map(operator.mul, saturations, itertools.repeat(saturation_scale)), itertools.repeat(1.0)))
+    if value_scale != 1:
+        values = list(map(min, map(operator.mul, values, itertools.repeat(value_scale)), itertools.repeat(1.0)))
+    return hues, saturations, values
+
+
+def adjust_colors(image: io.BytesIO, hue_shift: float = 0.0, saturation_scale: float = 1.0, value_scale: float = 1.0, space: str = "hsv") -> None:
+    """
+    Turn the hue of every pixel and make its saturation and value (or
+    lightness) bigger or smaller. Each different color is only worked out
+    once.
+
+    :param image: The bmp bytes
+    :param hue_shift: How far to turn the hue (1 is all the way around the color wheel)
+    :param saturation_scale: What to multiply the saturation by
+    :param value_scale: What to multiply the value (or lightness) by
+    :param space: "hsv" or "hsl"
+    :returns: None
+    """
+    from_rgb, to_rgb = _get_space(space)
+
+    def adjust(color: Color) -> Color:
+        h, s, v = from_rgb(color[0] / 255, color[1] / 255, color[2] / 255)
+        r, g, b = to_rgb((h + hue_shift) % 1.0, min(s * saturation_scale, 1.0), min(v * value_scale, 1.0))
+        return _to_byte(r), _to_byte(g), _to_byte(b)
+
+    map_colors(image, adjust)
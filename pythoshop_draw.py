@@ -0,0 +1,205 @@
+"""PythoShop Draw
+
+Fast drawing helpers (lines, rectangles, frames) for filters and tools.
+Shapes are turned into "spans" (a run of pixels in a single row), which
+are clipped to the image once and then written with a single write each,
+rather than setting every pixel one at a time.
+"""
+
+import io
+import typing
+
+from pythoshop_exports import _count_write, _get_header, invalidate_stats, will_write_rows
+
+Span = tuple[int, int, int]  # (y, first x, x after the last one)
+
+
+def _color_bytes(color: tuple[int, int, int]) -> bytes:
+    return bytes((color[2], color[1], color[0]))
+
+
+def fill_spans(image: io.BytesIO, spans: typing.Iterable[Span], color: tuple[int, int, int]) -> None:
+    """
+    Set every pixel in a group of spans to a color. Parts of spans that are
+    outside of the image are ignored.
+
+    :param image: The bmp bytes
+    :param spans: (y, x_start, x_stop) tuples; x_stop is *not* included
+    :param color: An (r, g, b) tuple for the color to draw with
+    :returns: None
+    """
+    header = _get_header(image)
+    pixel = _color_bytes(color)
+    invalidate_stats(image)
+    num_pixels = 0
+    for y, x_start, x_stop in spans:
+        if y < 0 or y >= header.height:
+            continue
+        x_start = max(x_start, 0)
+        x_stop = min(x_stop, header.width)
+        if x_start < x_stop:
+            will_write_rows(image, y)
+            image.seek(header.fpp + header.row_size * y + x_start * 3)
+            image.write(pixel * (x_stop - x_start))
+            num_pixels += x_stop - x_start
+    _count_write("fill_spans", num_pixels * 3, num_pixels)
+
+
+def rect_spans(x: int, y: int, width: int, height: int) -> list[Span]:
+    """
+    Get the spans that make up a filled rectangle
+
+    :param x: x coordinate of the bottom left corner
+    :param y: y coordinate of the bottom left corner
+    :param width: Width of the rectangle
+    :param height: Height of the rectangle
+    :returns: One span for each row of the rectangle
+    """
+    return [(row, x, x + width) for row in range(y, y + height)]
+
+
+def line_spans(start: tuple[int, int], end: tuple[int, int], thickness: int = 1) -> list[Span]:
+    """
+    Get the spans that make up a (possibly sloping) line from start to end,
+    using Bresenham's line algorithm. Thick lines get wider up/down if they
+    are mostly horizontal and left/right if they are mostly vertical.
+
+    :param start: (x, y) of one end of the line
+    :param end: (x, y) of the other end of the line
+    :param thickness: How many pixels thick the line is
+    :returns: One span for each row that the line touches
+    """
+    x0, y0 = start
+    x1, y1 = end
+    dx = abs(x1 - x0)
+    dy = -abs(y1 - y0)
+    step_x = 1 if x0 < x1 else -1
+    step_y = 1 if y0 < y1 else -1
+    mostly_horizontal = dx >= -dy
+    before = (thickness - 1) // 2  # extra pixels on each side of the center of the line
+    after = thickness - 1 - before
+
+    rows: dict[int, list[int]] = {}  # y -> [smallest x, largest x]
+    error = dx + dy
+    while True:
+        if mostly_horizontal:
+            points = [(x0, row) for row in range(y0 - before, y0 + after + 1)]
+        else:
+            points = [(x0 - before, y0), (x0 + after, y0)]
+        for x, y in points:
+            if y in rows:
+                rows[y][0] = min(rows[y][0], x)
+                rows[y][1] = max(rows[y][1], x)
+            else:
+                rows[y] = [x, x]
+        if x0 == x1 and y0 == y1:
+            break
+        doubled_error = 2 * error
+        if doubled_error >= dy:
+            error += dy
+            x0 += step_x
+        if doubled_error <= dx:
+            error += dx
+            y0 += step_y
+    return [(y, first_x, last_x + 1) for y, (first_x, last_x) in sorted(rows.items())]
+
+
+def draw_hline(image: io.BytesIO, y: int, color: tuple[int, int, int], *, x_start: int = 0, x_stop: typing.Optional[int] = None, thickness: int = 1) -> None:
+    """
+    Draw a horizontal line (centered on row y if it is thick)
+
+    :param image: The bmp bytes
+    :param y: The row to draw the line on
+    :param color: An (r, g, b) tuple for the color to draw with
+    :param x_start: Where the line starts
+    :param x_stop: Where the line stops (not included); the right edge if None
+    :param thickness: How many rows thick the line is
+    :returns: None
+    """
+    if x_stop is None:
+        x_stop = _get_header(image).width
+    first_row = y - (thickness - 1) // 2
+    fill_spans(image, rect_spans(x_start, first_row, x_stop - x_start, thickness), color)
+
+
+def draw_vline(image: io.BytesIO, x: int, color: tuple[int, int, int], *, y_start: int = 0, y_stop: typing.Optional[int] = None, thickness: int = 1) -> None:
+    """
+    Draw a vertical line (centered on column x if it is thick)
+
+    :param image: The bmp bytes
+    :param x: The column to draw the line on
+    :param color: An (r, g, b) tuple for the color to draw with
+    :param y_start: Where the line starts
+    :param y_stop: Where the line stops (not included); the top edge if None
+    :param thickness: How many columns thick the line is
+    :returns: None
+    """
+    if y_stop is None:
+        y_stop = _get_header(image).height
+    first_column = x - (thickness - 1) // 2
+    fill_spans(image, rect_spans(first_column, y_start, thickness, y_stop - y_start), color)
+
+
+def draw_rect(image: io.BytesIO, x: int, y: int, width: int, height: int, color: tuple[int, int, int]) -> None:
+    """
+    Draw a filled rectangle
+
+    :param image: The bmp bytes
+    :param x: x coordinate of the bottom left corner
+    :param y: y coordinate of the bottom left corner
+    :param width: Width of the rectangle
+    :param height: Height of the rectangle
+    :param color: An (r, g, b) tuple for the color to draw with
+    :returns: None
+    """
+    fill_spans(image, rect_spans(x, y, width, height), color)
+
+
+def draw_frame(image: io.BytesIO, color: tuple[int, int, int], thickness: int = 1) -> None:
+    """
+    Draw a frame around the edges of an image
+
+    :param image: The bmp bytes
+    :param color: An (r, g, b) tuple for the color to draw with
+    :param thickness: How many pixels thick the frame is
+    :returns: None
+    """
+    header = _get_header(image)
+    spans = []
+    for y in range(header.height):
+        if y < thickness or y >= header.height - thickness:
+            spans.append((y, 0, header.width))
+        else:
+            spans.append((y, 0, thickness))
+            spans.append((y, header.width - thickness, header.width))
+    fill_spans(image, spans, color)
+
+
+def draw_line(image: io.BytesIO, start: tuple[int, int], end: tuple[int, int], color: tuple[int, int, int], thickness: int = 1) -> None:
+    """
+    Draw a (possibly sloping) line between two points
+
+    :param image: The bmp bytes
+    :param start: (x, y) of one end of the line
+    :param end: (x, y) of the other end of the line
+    :param color: An (r, g, b) tuple for the color to draw with
+    :param thickness: How many pixels thick the line is
+    :returns: None
+    """
+    fill_spans(image, line_spans(start, end, thickness), color)
+
+
+def draw_x(image: io.BytesIO, color: tuple[int, int, int], thickness: int = 1) -> None:
+    """
+    Draw lines between opposite corners of an image
+
+    :param image: The bmp bytes
+    :param color: An (r, g, b) tuple for the color to draw with
+    :param thickness: How many pixels thick the lines are
+    :returns: None
+    """
+    header = _get_header(image)
+    right = header.width - 1
+    top = header.height - 1
+    draw_line(image, (0, 0), (right, top), color, thickness)
+    draw_line(image, (0, top), (right, 0), color, thickness)
@@ -4,40 +4,265 @@ Defines the decorators used to automatically export functions
 from image_manip.py into the PythoShop GUI application.
 """
 
+import collections
+import contextlib
 import functools
 import io
+import itertools
+import mmap
+import operator
+import os
+import sys
+import threading
+import time
+import typing
+import weakref
 
 
-def export_filter(func):
+def export_filter(func=None, *, parallel: bool = False, preview: bool = True):
     """Decorator
     describes a function that will be called on an image
     *as a whole* immediately when the user selects it.
+
+    Use `@export_filter(parallel=True)` for filters where each pixel only
+    depends on itself (not its neighbors or the secondary image) to run them
+    on several processes at once for big images.
+
+    For big images, the filter is first run on a smaller copy so there is
+    something to look at while the real result is worked out. Use
+    `@export_filter(preview=False)` for filters that would look wrong on a
+    smaller copy (e.g. ones that draw at exact coordinates).
     """
+    if func is None:
+        return functools.partial(export_filter, parallel=parallel, preview=preview)
+
     func.__type__ = "filter"
     func.__return_type__ = None
+    func.__parallel__ = parallel
+    func.__preview__ = preview
 
     @functools.wraps(func)
     def wrapper(image, *args, **kwargs):
-        return func(image, *args, **kwargs)
+        invalidate_header(image)
+        try:
+            with _instrumented_run(func.__name__):
+                if parallel and not args:
+                    import pythoshop_parallel  # only loaded when a filter asks for it
+
+                    return pythoshop_parallel.run_in_bands(func, image, **kwargs)
+                return func(image, *args, **kwargs)
+        finally:
+            invalidate_header(image)
+            invalidate_stats(image)
 
     return wrapper
 
 
-def export_tool(func):
+def export_tool(func=None, *, batch: bool = False, interpolate: bool = False):
     """Decorator
     describes a function that will get selected and then called
     once the user clicks on a specific position on the image.
+
+    While the mouse is dragged, the tool is called for every position it
+    moved through since the screen was last drawn. Use
+    `@export_tool(batch=True)` to get all of those positions in one call
+    (as a list in the `clicked_coordinates` argument, as well as the last one
+    in `clicked_coordinate`), and `@export_tool(interpolate=True)` to also
+    get the pixels in between positions so fast drags don't leave gaps.
     """
+    if func is None:
+        return functools.partial(export_tool, batch=batch, interpolate=interpolate)
+
     func.__type__ = "tool"
     func.__return_type__ = None
+    func.__batch__ = batch
+    func.__interpolate__ = interpolate
 
     @functools.wraps(func)
     def wrapper(image, clicked_coordinate, *args, **kwargs):
-        return func(image, clicked_coordinate, *args, **kwargs)
+        invalidate_header(image)
+        try:
+            with _instrumented_run(func.__name__):
+                return func(image, clicked_coordinate, *args, **kwargs)
+        finally:
+            invalidate_header(image)
+            invalidate_stats(image)
 
     return wrapper
 
 
+class PixelAccessStats:
+    """
+    Counts of how one run of a filter/tool used the pixel helpers, to help
+    find out why it is slow (see `enable_instrumentation`)
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.seconds = 0.0
+        self.calls: collections.Counter[str] = collections.Counter()
+        self.header_hits = 0
+        self.header_misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.call_sites: dict[str, list] = {}  # "helper at file:line" -> [number of calls, seconds spent]
+
+    def record(self, helper: str, *, bytes_read: int = 0, bytes_written: int = 0, started: typing.Optional[float] = None) -> None:
+        """
+        Count one call to a pixel helper
+
+        :param helper: Name of the helper that was called
+        :param bytes_read: How many bytes it read from the image
+        :param bytes_written: How many bytes it wrote to the image
+        :param started: When the helper started (to time the line that called it)
+        :returns: None
+        """
+        self.calls[helper] += 1
+        self.bytes_read += bytes_read
+        self.bytes_written += bytes_written
+        if started is not None:
+            caller = sys._getframe(2)  # skip this method and the helper itself
+            site = helper + " at " + os.path.basename(caller.f_code.co_filename) + ":" + str(caller.f_lineno)
+            totals = self.call_sites.setdefault(site, [0, 0.0])
+            totals[0] += 1
+            totals[1] += time.perf_counter() - started
+
+    def report(self) -> str:
+        """
+        Summarize the counts so they can be printed
+
+        :returns: A multi-line description of the run
+        """
+        lines = [f"{self.name} took {self.seconds:.3f}s"]
+        for helper, count in self.calls.most_common():
+            lines.append(f"  {helper}: {count} calls")
+        lines.append(f"  header lookups: {self.header_hits} remembered, {self.header_misses} read from the image")
+        lines.append(f"  bytes read: {self.bytes_read}, bytes written: {self.bytes_written}")
+        if self.call_sites:
+            lines.append("  slowest lines:")
+            for site, (count, seconds) in sorted(self.call_sites.items(), key=lambda item: item[1][1], reverse=True)[:10]:
+                lines.append(f"    {site}: {count} calls, {seconds:.3f}s")
+        return "\n".join(lines)
+
+
+_instrumentation_enabled = bool(os.environ.get("PYTHOSHOP_INSTRUMENT"))
+_current_stats: typing.Optional[PixelAccessStats] = None
+_last_stats: typing.Optional[PixelAccessStats] = None
+
+
+def enable_instrumentation(enabled: bool = True) -> None:
+    """
+    Turn on (or off) counting how filters/tools use the pixel helpers. It can
+    also be turned on by setting the PYTHOSHOP_INSTRUMENT environment variable.
+
+    :param enabled: Whether to count
+    :returns: None
+    """
+    global _instrumentation_enabled
+    _instrumentation_enabled = enabled
+
+
+def get_last_stats() -> typing.Optional[PixelAccessStats]:
+    """
+    Get the counts from the most recent filter/tool run
+
+    :returns: The counts (or None if instrumentation is off)
+    """
+    return _last_stats if _instrumentation_enabled else None
+
+
+@contextlib.contextmanager
+def _instrumented_run(name: str) -> typing.Iterator[None]:
+    """
+    Count pixel helper calls for one run of a filter/tool (if turned on). If a
+    filter calls another filter, everything is counted for the outer one.
+
+    :param name: Name of the filter/tool
+    """
+    global _current_stats, _last_stats
+    if not _instrumentation_enabled or _current_stats is not None:
+        yield
+        return
+
+    stats = PixelAccessStats(name)
+    _current_stats = stats
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.seconds = time.perf_counter() - started
+        _current_stats = None
+        _last_stats = stats
+
+
+class JobCancelled(BaseException):
+    """
+    Raised by the pixel helpers when the filter running in the background is
+    cancelled. Like KeyboardInterrupt, it isn't an Exception, so a filter's
+    `except Exception:` doesn't stop it.
+    """
+
+
+class Job:
+    """
+    A filter running in the background (see `running_job`). The pixel helpers
+    count how many pixels it has written, so its progress can be shown, and
+    stop it (by raising JobCancelled) once it has been cancelled.
+    """
+
+    __slots__ = ("total_pixels", "pixels_written", "cancelled", "thread_id")
+
+    def __init__(self, total_pixels: int) -> None:
+        self.total_pixels = total_pixels
+        self.pixels_written = 0
+        self.cancelled = False
+        self.thread_id: typing.Optional[int] = None
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def progress(self) -> typing.Optional[float]:
+        """
+        :returns: Roughly how much of the image has been written (0 to 1), or None if nothing has been written yet
+        """
+        if not self.pixels_written or not self.total_pixels:
+            return None
+        return min(self.pixels_written / self.total_pixels, 1.0)
+
+    def wrote(self, num_pixels: int) -> None:
+        """
+        Count pixels written by the job (and stop it if it was cancelled)
+
+        :param num_pixels: How many pixels were just written
+        :returns: None
+        """
+        if threading.get_ident() != self.thread_id:
+            return  # e.g. something on the main thread while the job runs
+        self.pixels_written += num_pixels
+        if self.cancelled:
+            raise JobCancelled()
+
+
+_current_job: typing.Optional[Job] = None
+
+
+@contextlib.contextmanager
+def running_job(job: Job) -> typing.Iterator[Job]:
+    """
+    Count pixel writes made by the current thread towards a job (only one
+    job can run at a time)
+
+    :param job: The job
+    """
+    global _current_job
+    job.thread_id = threading.get_ident()
+    _current_job = job
+    try:
+        yield job
+    finally:
+        _current_job = None
+
+
 def create_bmp(width: int, height: int) -> io.BytesIO:
     """
     Create a blank bitmap image (all black) that can then be customized by
@@ -63,10 +288,216 @@ def create_bmp(width: int, height: int) -> io.BytesIO:
     bmp.write((0).to_bytes(length=4, byteorder="little"))  # compression (none)
     bmp.seek(138)
     bmp.write(bytes(([0, 0, 0]) * width + [0] * row_padding) * height)
+    bmp.seek(10)
+    _headers[bmp] = (bmp.read(16), BmpHeader(fpp=138, width=width, height=height, padding=row_padding))
     return bmp
 
 
-@functools.lru_cache
+class BmpHeader(typing.NamedTuple):
+    """
+    The parts of a bitmap's header that are needed to find its pixels
+    """
+
+    fpp: int  # index of the byte where the pixels "start"
+    width: int
+    height: int
+    padding: int  # bytes added to the end of each row to make it a multiple of 4
+
+    @property
+    def row_size(self) -> int:
+        return self.width * 3 + self.padding
+
+
+# Headers are parsed once per image and remembered here, along with the header
+# bytes they were parsed from (so writing new ones into an io.BytesIO is noticed). The table only
+# holds weak references, so images that are no longer used can still be freed.
+_headers: "weakref.WeakKeyDictionary[typing.Any, tuple[bytes, BmpHeader]]" = weakref.WeakKeyDictionary()
+# The most recently used image and its header, as most code uses one image many times in a row
+_NO_HEADER: tuple[typing.Callable[[], typing.Any], bytes, typing.Optional[BmpHeader]] = (lambda: None, b"", None)
+_last_header = _NO_HEADER
+# Same for statistics (see `stats`), which are forgotten whenever pixels are written
+_image_stats: "weakref.WeakKeyDictionary[typing.Any, ImageStats]" = weakref.WeakKeyDictionary()
+
+
+def _parse_header(raw: bytes) -> BmpHeader:
+    """
+    Helper function to parse the header of a bitmap
+
+    :param raw: Bytes 10 to 26 of the bitmap (from the index of the first pixel to the height)
+    :returns: The parsed header
+    """
+    width = int.from_bytes(raw[8:12], byteorder="little")
+    row_size = width * 3
+    padding = 0
+    if row_size % 4 != 0:
+        padding = 4 - row_size % 4
+    return BmpHeader(
+        fpp=int.from_bytes(raw[0:4], byteorder="little"),
+        width=width,
+        height=int.from_bytes(raw[12:16], byteorder="little"),
+        padding=padding,
+    )
+
+
+def _get_header(image: io.BytesIO) -> BmpHeader:
+    """
+    Helper function to get the (remembered) header of a bitmap. For an
+    io.BytesIO, the header bytes are compared with the ones it was parsed
+    from (without moving the position in the image), so a header written
+    straight into the image is noticed. Other images (e.g. files) aren't
+    read again until the next filter/tool starts or finishes, or until
+    `invalidate_header` is called.
+
+    :param image: The bmp bytes
+    :returns: The parsed header
+    """
+    global _last_header
+    last_image, raw, header = _last_header
+    if last_image() is not image:  # not the same image as last time, so look it up
+        remembered = _headers.get(image)
+        if remembered is None:
+            header = None
+        else:
+            raw, header = remembered
+            _last_header = (weakref.ref(image), raw, header)
+    if header is not None and (not isinstance(image, io.BytesIO) or image.getbuffer()[10:26] == raw):
+        if _current_stats is not None:
+            _current_stats.header_hits += 1
+        return header
+
+    position = image.tell()
+    image.seek(10)
+    raw = image.read(16)
+    image.seek(position)
+    header = _parse_header(raw)
+    _headers[image] = (raw, header)
+    _last_header = (weakref.ref(image), raw, header)
+    if _current_stats is not None:
+        _current_stats.header_misses += 1
+    return header
+
+
+def invalidate_header(image: io.BytesIO) -> None:
+    """
+    Forget the remembered header of a bitmap so it is parsed again next time.
+
+    This happens automatically before and after every filter/tool runs, and
+    new header bytes written into an io.BytesIO are noticed straight away.
+    Only call it yourself if you write new header bytes into some other kind
+    of image (e.g. a file) and then use the pixel helpers on it.
+
+    :param image: The bmp bytes
+    :returns: None
+    """
+    global _last_header
+    _headers.pop(image, None)
+    if _last_header[0]() is image:
+        _last_header = _NO_HEADER
+
+
+def invalidate_stats(image: io.BytesIO) -> None:
+    """
+    Forget the remembered statistics of a bitmap so they are worked out again
+    next time `stats` is called.
+
+    This happens automatically after every filter/tool runs and whenever a
+    pythoshop_exports helper writes pixels. Only call it yourself if you
+    change pixels by writing bytes to the image directly.
+
+    :param image: The bmp bytes
+    :returns: None
+    """
+    if _image_stats:  # nearly always empty, so don't bother looking the image up
+        _image_stats.pop(image, None)
+
+
+class WrittenRows:
+    """
+    The rows of an image that were written to while it was watched (see
+    `watch_writes`), so only those rows need to be shown again or remembered
+    for undo
+    """
+
+    __slots__ = ("before", "first", "last")
+
+    def __init__(self) -> None:
+        self.before: dict[int, bytes] = {}  # what was in each row (including padding) before it was first written to
+        self.first: typing.Optional[int] = None  # the lowest and highest rows written since `take_span` was last called
+        self.last: typing.Optional[int] = None
+
+    def take_span(self) -> typing.Optional[tuple[int, int]]:
+        """
+        :returns: (first, last) of the rows written to since this was last called, or None if there weren't any
+        """
+        if self.first is None or self.last is None:
+            return None
+        span = (self.first, self.last)
+        self.first = self.last = None
+        return span
+
+
+# Images whose writes are being watched (see `watch_writes`)
+_watched_images: "weakref.WeakKeyDictionary[typing.Any, WrittenRows]" = weakref.WeakKeyDictionary()
+
+
+@contextlib.contextmanager
+def watch_writes(image: io.BytesIO, written: typing.Optional[WrittenRows] = None) -> typing.Iterator[WrittenRows]:
+    """
+    Keep track of the rows the pixel helpers write to in an image (and what
+    was in them before)
+
+    :param image: The bmp bytes
+    :param written: Rows from an earlier watch of the same image to keep adding to
+    """
+    if written is None:
+        written = WrittenRows()
+    _watched_images[image] = written
+    try:
+        yield written
+    finally:
+        _watched_images.pop(image, None)
+
+
+def will_write_rows(image: io.BytesIO, first_row: int, last_row: typing.Optional[int] = None) -> None:
+    """
+    Say that some rows of a bitmap are about to be changed, so PythoShop
+    can show (and undo) just those rows.
+
+    The pythoshop_exports helpers do this themselves. Only call it yourself
+    (before writing) if a tool changes pixels by writing bytes to the image
+    directly.
+
+    :param image: The bmp bytes
+    :param first_row: The lowest row (y coordinate) that will be changed
+    :param last_row: The highest row that will be changed (just first_row if not given)
+    :returns: None
+    """
+    if not _watched_images:  # nearly always empty, so don't bother looking the image up
+        return
+    written = _watched_images.get(image)
+    if written is None:
+        return
+    header = _get_header(image)
+    first_row = max(first_row, 0)
+    last_row = min(first_row if last_row is None else last_row, header.height - 1)
+    if first_row > last_row:
+        return
+    if written.first is None or first_row < written.first:
+        written.first = first_row
+    if written.last is None or last_row > written.last:
+        written.last = last_row
+
+    new_rows = [y for y in range(first_row, last_row + 1) if y not in written.before]
+    if new_rows:
+        position = image.tell()
+        image.seek(header.fpp + header.row_size * new_rows[0])
+        old = image.read(header.row_size * (new_rows[-1] + 1 - new_rows[0]))
+        image.seek(position)
+        for y in new_rows:
+            start = header.row_size * (y - new_rows[0])
+            written.before[y] = old[start : start + header.row_size]
+
+
 def _get_fpp(image: io.BytesIO) -> int:
     """
     Helper function to get the point in a bitmap file where the image "starts"
@@ -74,11 +505,9 @@ def _get_fpp(image: io.BytesIO) -> int:
     :param image: The bmp bytes
     :returns: The index of the byte where the pixels "start"
     """
-    image.seek(10)
-    return int.from_bytes(image.read(4), byteorder="little")
+    return _get_header(image).fpp
 
 
-@functools.lru_cache
 def get_height(image: io.BytesIO) -> int:
     """
     Helper function to get the height of a particular bitmap
@@ -86,11 +515,9 @@ def get_height(image: io.BytesIO) -> int:
     :param image: The bmp bytes
     :returns: The height of the bitmap
     """
-    image.seek(22)
-    return int.from_bytes(image.read(4), byteorder="little")
+    return _get_header(image).height
 
 
-@functools.lru_cache
 def get_width(image: io.BytesIO) -> int:
     """
     Helper function to get the width of a particular bitmap
@@ -98,18 +525,11 @@ def get_width(image: io.BytesIO) -> int:
     :param image: The bmp bytes
     :returns: The width of the bitmap
     """
-    image.seek(18)
-    return int.from_bytes(image.read(4), byteorder="little")
+    return _get_header(image).width
 
 
-@functools.lru_cache
 def _get_padding(image: io.BytesIO) -> int:
-    width = get_width(image)
-    row_size = width * 3
-    if row_size % 4 != 0:
-        return 4 - row_size % 4
-    else:
-        return 0
+    return _get_header(image).padding
 
 
 def _seek_x_y(image: io.BytesIO, x_y_tuple: tuple[int, int]) -> None:
@@ -120,10 +540,10 @@ def _seek_x_y(image: io.BytesIO, x_y_tuple: tuple[int, int]) -> None:
     :param x_y_tuple: An (x, y) tuple that represents the coordinates of a particular pixel
     :returns: None
     """
-    fpp = _get_fpp(image)
-    width = get_width(image)
-    padding = _get_padding(image)
-    image.seek(fpp + ((width * 3 + padding) * x_y_tuple[1]) + (x_y_tuple[0] * 3))
+    if _current_stats is not None:
+        _current_stats.record("_seek_x_y")
+    header = _get_header(image)
+    image.seek(header.fpp + (header.row_size * x_y_tuple[1]) + (x_y_tuple[0] * 3))
 
 
 def get_pixel_rgb(image: io.BytesIO, x_y_tuple: tuple[int, int]) -> tuple[int, int, int]:
@@ -134,10 +554,15 @@ def get_pixel_rgb(image: io.BytesIO, x_y_tuple: tuple[int, int]) -> tuple[int, i
     :param x_y_tuple: An (x, y) tuple that represents the coordinates of a particular pixel
     :returns: (r, g, b) tuple
     """
+    stats = _current_stats
+    if stats is not None:
+        started = time.perf_counter()
     _seek_x_y(image, x_y_tuple)
     b = int.from_bytes(image.read(1), byteorder="little")
     g = int.from_bytes(image.read(1), byteorder="little")
     r = int.from_bytes(image.read(1), byteorder="little")
+    if stats is not None:
+        stats.record("get_pixel_rgb", bytes_read=3, started=started)
     return r, g, b
 
 
@@ -150,7 +575,615 @@ def set_pixel_rgb(image: io.BytesIO, x_y_tuple: tuple[int, int], r_g_b_tuple: tu
     :param r_g_b_tuple: An (r, g, b) tuple that represents color to set pixel to
     :returns: None
     """
+    stats = _current_stats
+    if stats is not None:
+        started = time.perf_counter()
+    if _watched_images:  # only while the GUI runs a tool
+        will_write_rows(image, x_y_tuple[1])
     _seek_x_y(image, x_y_tuple)
+    if _image_stats:  # invalidate_stats(image) without the function call, as this runs for every pixel
+        _image_stats.pop(image, None)
     image.write(r_g_b_tuple[2].to_bytes(length=1, byteorder="little"))
     image.write(r_g_b_tuple[1].to_bytes(length=1, byteorder="little"))
     image.write(r_g_b_tuple[0].to_bytes(length=1, byteorder="little"))
+    if stats is not None:
+        stats.record("set_pixel_rgb", bytes_written=3, started=started)
+    if _current_job is not None:
+        _current_job.wrote(1)
+
+
+def as_array(image: io.BytesIO):
+    """
+    Get a NumPy array that *views* the pixels of a bitmap (no copying)
+
+    The array has shape (height, width, 3) and the channels are in (r, g, b)
+    order, so `as_array(image)[y, x]` is the same pixel as
+    `get_pixel_rgb(image, (x, y))`. Writing to the array changes the image
+    itself. Note: while the array exists, the image can't change size. In a
+    tool, call `will_write_rows` before changing pixels through the array.
+
+    :param image: The bmp bytes (must be in memory, e.g. an io.BytesIO)
+    :returns: A (height, width, 3) uint8 array of the pixels
+    """
+    import numpy  # only needed for this helper, so don't require it everywhere
+
+    if not hasattr(image, "getbuffer"):
+        raise TypeError("as_array() needs an in-memory image (like an io.BytesIO), not " + type(image).__name__)
+
+    header = _get_header(image)
+    # Pixels are stored as (b, g, r), so start on the red byte and walk the channels backwards
+    return numpy.ndarray(
+        shape=(header.height, header.width, 3),
+        dtype=numpy.uint8,
+        buffer=image.getbuffer(),
+        offset=header.fpp + 2,
+        strides=(header.row_size, 3, -1),
+    )
+
+
+def _read_pixel_area(image: io.BytesIO) -> bytearray:
+    """
+    Helper function to read all of the pixel bytes (including padding) at once
+
+    :param image: The bmp bytes
+    :returns: The bytes of every row, starting from the bottom row
+    """
+    header = _get_header(image)
+    image.seek(header.fpp)
+    pixels = bytearray(image.read(header.row_size * header.height))
+    if _current_stats is not None:
+        _current_stats.record("read all pixels", bytes_read=len(pixels))
+    return pixels
+
+
+def _write_pixel_area(image: io.BytesIO, pixels: bytes) -> None:
+    """
+    Helper function to write all of the pixel bytes (including padding) at once
+
+    :param image: The bmp bytes
+    :param pixels: The bytes of every row, starting from the bottom row
+    :returns: None
+    """
+    invalidate_stats(image)
+    will_write_rows(image, 0, _get_header(image).height - 1)
+    image.seek(_get_fpp(image))
+    image.write(pixels)
+    if _current_stats is not None:
+        _current_stats.record("write all pixels", bytes_written=len(pixels))
+    if _current_job is not None:
+        _current_job.wrote(len(pixels) // 3)
+
+
+def _count_write(helper: str, bytes_written: int, num_pixels: int) -> None:
+    """
+    Helper function for pixel helpers that write to an image themselves (in
+    other modules) to count the write, like the helpers here do
+
+    :param helper: Name of the helper that wrote
+    :param bytes_written: How many bytes it wrote to the image
+    :param num_pixels: How many pixels it wrote
+    :returns: None
+    """
+    if _current_stats is not None:
+        _current_stats.record(helper, bytes_written=bytes_written)
+    if _current_job is not None:
+        _current_job.wrote(num_pixels)
+
+
+def _pixel_spans(header: BmpHeader) -> list[tuple[int, int]]:
+    """
+    Helper function to find the parts of the pixel area that aren't padding
+
+    :param header: The header of the image
+    :returns: (start, stop) byte indexes in the pixel area of each row (or the whole area if there's no padding)
+    """
+    if header.padding == 0:
+        return [(0, header.row_size * header.height)]  # no padding, so the whole image can be done as one "row"
+    return [(start, start + header.width * 3) for start in range(0, header.row_size * header.height, header.row_size)]
+
+
+def _build_lut(lut: typing.Union[None, bytes, typing.Sequence[int], typing.Callable[[int], int]]) -> typing.Optional[bytes]:
+    """
+    Helper function to turn a lookup table description into a 256 byte table
+
+    :param lut: None (leave channel alone), a function from old value to new value, or a list of 256 values
+    :returns: The table for bytes.translate (or None if the channel doesn't change)
+    """
+    if lut is None:
+        return None
+    if callable(lut):
+        lut = [lut(value) for value in range(256)]
+    table = bytes(lut)
+    if len(table) != 256:
+        raise ValueError("a lookup table needs exactly 256 values but has " + str(len(table)))
+    return table
+
+
+def apply_channel_luts(image: io.BytesIO, r_lut=None, g_lut=None, b_lut=None) -> None:
+    """
+    Change every pixel of an image by looking up each channel's new value in a
+    table. For example, `apply_channel_luts(image, lambda r: 255 - r)` negates
+    the red part of every pixel.
+
+    Each table can be a function (called once for every value 0-255), a list of
+    256 values, or None to leave that channel alone.
+
+    :param image: The bmp bytes
+    :param r_lut: Table for the red part of each pixel
+    :param g_lut: Table for the green part of each pixel
+    :param b_lut: Table for the blue part of each pixel
+    :returns: None
+    """
+    tables = [_build_lut(b_lut), _build_lut(g_lut), _build_lut(r_lut)]  # the order they're stored in
+    if tables == [None, None, None]:
+        return
+
+    pixels = _read_pixel_area(image)
+    for start, stop in _pixel_spans(_get_header(image)):
+        for channel, table in enumerate(tables):
+            if table is not None:
+                pixels[start + channel : stop : 3] = pixels[start + channel : stop : 3].translate(table)
+    _write_pixel_area(image, pixels)
+
+
+def _decode_row(raw: bytes, width: int) -> list[tuple[int, int, int]]:
+    """
+    Helper function to turn the bytes of a row into (r, g, b) tuples
+
+    :param raw: The bytes of the row (padding at the end is ignored)
+    :param width: The number of pixels in the row
+    :returns: List of (r, g, b) tuples
+    """
+    stop = width * 3
+    return list(zip(raw[2:stop:3], raw[1:stop:3], raw[0:stop:3]))
+
+
+def get_row(image: io.BytesIO, y: int) -> list[tuple[int, int, int]]:
+    """
+    Helper function to get the RGB values of a whole row of pixels at once
+
+    :param image: The bmp bytes
+    :param y: The y coordinate of the row (0 is the bottom row)
+    :returns: List of (r, g, b) tuples, one for each x coordinate
+    """
+    stats = _current_stats
+    if stats is not None:
+        started = time.perf_counter()
+    header = _get_header(image)
+    image.seek(header.fpp + header.row_size * y)
+    row = _decode_row(image.read(header.row_size), header.width)
+    if stats is not None:
+        stats.record("get_row", bytes_read=header.row_size, started=started)
+    return row
+
+
+def set_row(image: io.BytesIO, y: int, data: typing.Sequence[tuple[int, int, int]]) -> None:
+    """
+    Helper function to set the RGB values of a whole row of pixels at once
+
+    :param image: The bmp bytes
+    :param y: The y coordinate of the row (0 is the bottom row)
+    :param data: List of (r, g, b) tuples, one for each x coordinate
+    :returns: None
+    """
+    stats = _current_stats
+    if stats is not None:
+        started = time.perf_counter()
+    header = _get_header(image)
+    if len(data) != header.width:
+        raise ValueError("the row has " + str(len(data)) + " pixels but the image is " + str(header.width) + " pixels wide")
+    row = bytearray(header.width * 3)
+    if data:
+        reds, greens, blues = zip(*data)
+        row[0::3] = bytes(blues)
+        row[1::3] = bytes(greens)
+        row[2::3] = bytes(reds)
+    invalidate_stats(image)
+    will_write_rows(image, y)
+    image.seek(header.fpp + header.row_size * y)
+    image.write(row)
+    if stats is not None:
+        stats.record("set_row", bytes_written=len(row), started=started)
+    if _current_job is not None:
+        _current_job.wrote(header.width)
+
+
+def iter_rows(image: io.BytesIO) -> typing.Iterator[list[tuple[int, int, int]]]:
+    """
+    Go through the rows of an image from the bottom (y = 0) to the top. Use it
+    like `for y, row in enumerate(iter_rows(image)):`
+
+    :param image: The bmp bytes
+    :returns: A list of (r, g, b) tuples for each row
+    """
+    header = _get_header(image)
+    for y in range(header.height):
+        image.seek(header.fpp + header.row_size * y)
+        raw = image.read(header.row_size)
+        if _current_stats is not None:
+            _current_stats.record("iter_rows", bytes_read=len(raw))
+        yield _decode_row(raw, header.width)
+
+
+class PixelBuffer:
+    """
+    Loads all of an image's pixels into memory so they can be read and changed
+    quickly, then writes the changed rows back to the image at the end:
+
+        with PixelBuffer(image) as pixels:
+            r, g, b = pixels[x, y]
+            pixels[x, y] = (255 - r, 255 - g, 255 - b)
+    """
+
+    __slots__ = ("image", "header", "pixels", "dirty_rows")
+
+    def __init__(self, image: io.BytesIO) -> None:
+        self.image = image
+        self.header = _get_header(image)
+        self.pixels = bytearray()
+        self.dirty_rows: set[int] = set()
+
+    @property
+    def width(self) -> int:
+        return self.header.width
+
+    @property
+    def height(self) -> int:
+        return self.header.height
+
+    def __enter__(self) -> "PixelBuffer":
+        self.header = _get_header(self.image)
+        self.pixels = _read_pixel_area(self.image)
+        self.dirty_rows = set()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.flush()
+
+    def _index(self, x_y_tuple: tuple[int, int]) -> int:
+        x, y = x_y_tuple
+        if not (0 <= x < self.header.width and 0 <= y < self.header.height):
+            raise IndexError("pixel (" + str(x) + ", " + str(y) + ") is outside of the image")
+        return self.header.row_size * y + x * 3
+
+    def __getitem__(self, x_y_tuple: tuple[int, int]) -> tuple[int, int, int]:
+        index = self._index(x_y_tuple)
+        b, g, r = self.pixels[index : index + 3]
+        return r, g, b
+
+    def __setitem__(self, x_y_tuple: tuple[int, int], r_g_b_tuple: tuple[int, int, int]) -> None:
+        index = self._index(x_y_tuple)
+        self.pixels[index : index + 3] = bytes((r_g_b_tuple[2], r_g_b_tuple[1], r_g_b_tuple[0]))
+        self.dirty_rows.add(x_y_tuple[1])
+
+    def flush(self) -> None:
+        """
+        Write the rows that were changed back into the image (touching rows
+        are written together)
+
+        :returns: None
+        """
+        row_size = self.header.row_size
+        rows = sorted(self.dirty_rows)
+        if rows:
+            invalidate_stats(self.image)
+        start = 0
+        while start < len(rows):
+            stop = start + 1
+            while stop < len(rows) and rows[stop] == rows[stop - 1] + 1:
+                stop += 1
+            first, last = rows[start], rows[stop - 1]
+            will_write_rows(self.image, first, last)
+            self.image.seek(self.header.fpp + row_size * first)
+            self.image.write(self.pixels[row_size * first : row_size * (last + 1)])
+            if _current_stats is not None:
+                _current_stats.record("PixelBuffer.flush", bytes_written=row_size * (last + 1 - first))
+            if _current_job is not None:
+                _current_job.wrote(self.header.width * (last + 1 - first))
+            start = stop
+        self.dirty_rows = set()
+
+
+# Bitmap files at least this big are mapped into memory rather than read into it
+MAPPED_IMAGE_MIN_BYTES = 64 * 1024 * 1024
+
+
+class MappedBmp:
+    """
+    A bitmap file that is used "in place" (through mmap) rather than being
+    read into an io.BytesIO. It can be passed to any of the helpers above,
+    but only the parts of the file that are actually used get loaded, which
+    keeps memory low for very large images.
+
+    Changes are private to this object: they are *not* written back to the
+    file. Unlike an io.BytesIO, the image can't grow or shrink.
+    """
+
+    __slots__ = ("file_name", "_file", "_map", "_changed_chunks", "__weakref__")
+
+    # Which parts of the map have been changed is remembered in chunks this big (see `copy`)
+    CHUNK_BYTES = 64 * 1024
+
+    def __init__(self, file_name: str) -> None:
+        self.file_name = file_name
+        self._file = open(file_name, "rb")  # kept open so `copy` maps the same file even if it is replaced
+        # copy-on-write: pages are shared with the OS's file cache until they are written to
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        self._changed_chunks: set[int] = set()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._map.seek(offset, whence)
+        return self._map.tell()
+
+    def tell(self) -> int:
+        return self._map.tell()
+
+    def read(self, size: typing.Optional[int] = -1) -> bytes:
+        return self._map.read(size)
+
+    def write(self, data: bytes) -> int:
+        position = self._map.tell()
+        if data:
+            self._changed_chunks.update(range(position // self.CHUNK_BYTES, (position + len(data) - 1) // self.CHUNK_BYTES + 1))
+        return self._map.write(data)
+
+    def getbuffer(self) -> memoryview:
+        # The buffer could be written to, so treat all of it as changed
+        self._changed_chunks.update(range(len(self._map) // self.CHUNK_BYTES + 1))
+        return memoryview(self._map)
+
+    def getvalue(self) -> bytes:
+        return self._map[:]
+
+    def getmap(self) -> mmap.mmap:
+        """
+        :returns: The map itself, which can be sliced like the bytes from `getvalue` without copying all of it (don't write to it)
+        """
+        return self._map
+
+    def copy(self) -> "MappedBmp":
+        """
+        Make a second copy-on-write map of the same file, with the changes made
+        to this one so far, without reading the whole file into memory
+
+        :returns: The copy (changing it doesn't change this one)
+        """
+        other = MappedBmp.__new__(MappedBmp)
+        other.file_name = self.file_name
+        other._file = os.fdopen(os.dup(self._file.fileno()), "rb")
+        other._map = mmap.mmap(other._file.fileno(), 0, access=mmap.ACCESS_COPY)
+        for chunk in self._changed_chunks:
+            start = chunk * self.CHUNK_BYTES
+            other._map[start : start + self.CHUNK_BYTES] = self._map[start : start + self.CHUNK_BYTES]
+        other._changed_chunks = set(self._changed_chunks)
+        return other
+
+    def close(self) -> None:
+        self._map.close()
+        self._file.close()
+
+    @property
+    def closed(self) -> bool:
+        return self._map.closed
+
+
+def parse_offset(extra: str) -> tuple[int, int]:
+    """
+    Get an (x, y) offset out of the "extra parameters..." text (e.g. "10, 20")
+
+    :param extra: The text to look in
+    :returns: The (x, y) offset, or (0, 0) if the text isn't two numbers
+    """
+    parts = extra.replace(" ", "").split(",")
+    try:
+        return int(parts[0]), int(parts[1])
+    except (ValueError, IndexError):
+        return 0, 0
+
+
+def _copy_image(image: io.BytesIO) -> io.BytesIO:
+    """
+    Helper function to make an in-memory copy of an image
+
+    :param image: The bmp bytes
+    :returns: A new io.BytesIO with the same contents
+    """
+    image.seek(0)
+    return io.BytesIO(image.read())
+
+
+def _overlapping_rows(image: io.BytesIO, other: io.BytesIO, offset: tuple[int, int]) -> typing.Iterator[tuple[int, int, int]]:
+    """
+    Helper function to find where an image overlaps another image that has
+    been moved by an offset
+
+    :param image: The bmp bytes of the bottom image
+    :param other: The bmp bytes of the image placed on top
+    :param offset: Where the bottom left corner of `other` is placed on `image`
+    :returns: (byte index in image, byte index in other, number of bytes) for every overlapping row
+    """
+    header = _get_header(image)
+    other_header = _get_header(other)
+    first_x = max(0, offset[0])
+    last_x = min(header.width, offset[0] + other_header.width)
+    first_y = max(0, offset[1])
+    last_y = min(header.height, offset[1] + other_header.height)
+    for y in range(first_y, last_y):
+        if first_x < last_x:
+            yield (
+                header.row_size * y + first_x * 3,
+                other_header.row_size * (y - offset[1]) + (first_x - offset[0]) * 3,
+                (last_x - first_x) * 3,
+            )
+
+
+@functools.lru_cache(maxsize=32)
+def _blend_table(weight: float) -> bytes:
+    """
+    Helper function to build a table of every possible blend of two values:
+    the entry at (a * 256 + b) is `a` mixed with `weight` of `b` (rounded)
+
+    :param weight: How much of the second value to use (0 to 1)
+    :returns: 65536 blended values
+    """
+    return bytes(int(a * (1 - weight) + b * weight + 0.5) for a in range(256) for b in range(256))
+
+
+def blend_images(image: io.BytesIO, other: io.BytesIO, weight: float = 0.5, offset: tuple[int, int] = (0, 0)) -> io.BytesIO:
+    """
+    Create a copy of an image with another image blended on top of it. Only
+    the part where the two images overlap is blended.
+
+    :param image: The bmp bytes of the bottom image
+    :param other: The bmp bytes of the image placed on top
+    :param weight: How much of the top image to use (0 to 1; 0.5 is an even mix)
+    :param offset: Where the bottom left corner of `other` is placed on `image`
+    :returns: A new image
+    """
+    if not 0 <= weight <= 1:
+        raise ValueError("weight must be between 0 and 1, not " + str(weight))
+    result = _copy_image(image)
+    pixels = _read_pixel_area(result)
+    other_pixels = _read_pixel_area(other)
+    table = _blend_table(weight)
+    for start, other_start, length in _overlapping_rows(result, other, offset):
+        bottom = pixels[start : start + length]
+        top = other_pixels[other_start : other_start + length]
+        indexes = map(operator.or_, map(operator.lshift, bottom, itertools.repeat(8)), top)
+        pixels[start : start + length] = bytes(map(table.__getitem__, indexes))
+    _write_pixel_area(result, pixels)
+    return result
+
+
+@functools.lru_cache(maxsize=32)
+def _squared_distance_table(key: int) -> list[int]:
+    return [(value - key) ** 2 for value in range(256)]
+
+
+def chroma_overlay(
+    image: io.BytesIO, other: io.BytesIO, key_color: tuple[int, int, int], tolerance: float = 0, offset: tuple[int, int] = (0, 0)
+) -> io.BytesIO:
+    """
+    Create a copy of an image with another image placed on top of it, except
+    where the top image is (close to) the "key" color, e.g. a green screen.
+
+    :param image: The bmp bytes of the bottom image
+    :param other: The bmp bytes of the image placed on top
+    :param key_color: An (r, g, b) tuple of the color to see through
+    :param tolerance: How far (straight-line distance between the r, g, b values) a color can be from the key and still be seen through
+    :param offset: Where the bottom left corner of `other` is placed on `image`
+    :returns: A new image
+    """
+    result = _copy_image(image)
+    pixels = _read_pixel_area(result)
+    other_pixels = _read_pixel_area(other)
+    blue_distances = _squared_distance_table(key_color[2])
+    green_distances = _squared_distance_table(key_color[1])
+    red_distances = _squared_distance_table(key_color[0])
+    for start, other_start, length in _overlapping_rows(result, other, offset):
+        top = other_pixels[other_start : other_start + length]
+        distances = map(
+            operator.add,
+            map(operator.add, map(blue_distances.__getitem__, top[0::3]), map(green_distances.__getitem__, top[1::3])),
+            map(red_distances.__getitem__, top[2::3]),
+        )
+        shows = bytes(map(operator.gt, distances, itertools.repeat(tolerance * tolerance)))  # 1 where the top pixel is kept
+        use_top = bytearray(length)
+        use_top[0::3] = shows
+        use_top[1::3] = shows
+        use_top[2::3] = shows
+        bottom = pixels[start : start + length]
+        pixels[start : start + length] = bytes(map(operator.getitem, zip(bottom, top), use_top))
+    _write_pixel_area(result, pixels)
+    return result
+
+
+def map_colors(image: io.BytesIO, func: typing.Callable[[tuple[int, int, int]], tuple[int, int, int]]) -> None:
+    """
+    Change every pixel of an image to `func(its color)`. The function is only
+    called once for each different color in the image (photos usually have
+    far fewer colors than pixels), so it can be slow-ish.
+
+    :param image: The bmp bytes
+    :param func: Function that takes an (r, g, b) tuple and returns the new (r, g, b) tuple
+    :returns: None
+    """
+    new_colors: dict[tuple[int, int, int], bytes] = {}  # old (r, g, b) -> new bytes (in the order they're stored)
+    pixels = _read_pixel_area(image)
+    for start, stop in _pixel_spans(_get_header(image)):
+        colors = list(zip(pixels[start + 2 : stop : 3], pixels[start + 1 : stop : 3], pixels[start:stop:3]))
+        for color in set(colors).difference(new_colors):
+            r, g, b = func(color)
+            new_colors[color] = bytes((b, g, r))
+        pixels[start:stop] = b"".join(map(new_colors.__getitem__, colors))
+    _write_pixel_area(image, pixels)
+
+
+class ImageStats(typing.NamedTuple):
+    """
+    Statistics about all of the pixels of an image (see `stats`). Brightness
+    is the average of r, g and b, rounded down.
+    """
+
+    red_histogram: tuple[int, ...]  # red_histogram[value] is how many pixels have that much red
+    green_histogram: tuple[int, ...]
+    blue_histogram: tuple[int, ...]
+    brightness_histogram: tuple[int, ...]
+    minimum: tuple[int, int, int]  # smallest (r, g, b) values (not necessarily from the same pixel)
+    maximum: tuple[int, int, int]  # biggest (r, g, b) values
+    mean: tuple[float, float, float]  # average (r, g, b)
+    mean_brightness: float  # average of (r + g + b) / 3
+
+
+def _histogram(values: bytes) -> tuple[int, ...]:
+    counts = collections.Counter(values)
+    return tuple(counts[value] for value in range(256))
+
+
+def _histogram_summary(histogram: tuple[int, ...]) -> tuple[int, int, float]:
+    """
+    Helper function to get the smallest, biggest and average value from a histogram
+
+    :param histogram: How many times each value 0-255 appears
+    :returns: (smallest, biggest, average), or (0, 0, 0.0) if there are no values
+    """
+    used = [value for value in range(256) if histogram[value]]
+    if not used:
+        return 0, 0, 0.0
+    return used[0], used[-1], sum(map(operator.mul, range(256), histogram)) / sum(histogram)
+
+
+# Brightness for every possible r + g + b total
+_BRIGHTNESSES = bytes(total // 3 for total in range(766))
+
+
+def stats(image: io.BytesIO) -> ImageStats:
+    """
+    Get histograms, smallest/biggest values and averages for an image. They
+    are worked out in one go and remembered until the pixels are written
+    again, so it is fine to call this as often as you like (e.g. in a loop).
+
+    :param image: The bmp bytes
+    :returns: The statistics
+    """
+    image_stats = _image_stats.get(image)
+    if image_stats is not None:
+        return image_stats
+
+    pixels = _read_pixel_area(image)
+    spans = _pixel_spans(_get_header(image))
+    blues, greens, reds = (b"".join(pixels[start + channel : stop : 3] for start, stop in spans) for channel in range(3))
+    totals = map(operator.add, map(operator.add, reds, greens), blues)
+    histograms = (_histogram(reds), _histogram(greens), _histogram(blues))
+    brightness_histogram = _histogram(bytes(map(_BRIGHTNESSES.__getitem__, totals)))
+    minimums, maximums, means = zip(*map(_histogram_summary, histograms))
+    image_stats = ImageStats(
+        *histograms,
+        brightness_histogram=brightness_histogram,
+        minimum=minimums,
+        maximum=maximums,
+        mean=means,
+        mean_brightness=sum(means) / 3,
+    )
+    _image_stats[image] = image_stats
+    return image_stats
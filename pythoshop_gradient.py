@@ -0,0 +1,133 @@
+"""PythoShop Gradient
+
+Fast helpers for fade filters, where every pixel is mixed with a color by
+an amount that only depends on its row (vertical fades) or its column
+(horizontal fades). The amounts ("weights") are worked out once for each
+row or column, then whole rows are changed at a time.
+
+Pixels are mixed exactly like `blend_images` mixes them:
+`int(value * (1 - weight) + color * weight + 0.5)`.
+"""
+
+import io
+import itertools
+import operator
+import typing
+
+from pythoshop_exports import _get_header, _read_pixel_area, _write_pixel_area
+
+Color = tuple[int, int, int]
+Profile = typing.Callable[[float], float]  # how far along the fade (0 to 1) -> how much of the color (0 to 1)
+
+
+def linear(t: float) -> float:
+    return t
+
+
+def ease_in(t: float) -> float:
+    return t * t
+
+
+def ease_out(t: float) -> float:
+    return 1 - (1 - t) * (1 - t)
+
+
+def gradient_weights(length: int, profile: Profile = linear) -> list[float]:
+    """
+    Get a weight for each of `length` rows or columns, going from
+    profile(0) for the first one to profile(1) for the last one
+
+    :param length: How many weights are needed
+    :param profile: Function from how far along the fade (0 to 1) to the weight
+    :returns: The weights
+    """
+    steps = max(length - 1, 1)
+    return [profile(i / steps) for i in range(length)]
+
+
+def _mix_table(weight: float, color_value: int) -> bytes:
+    """
+    Helper function to build a table of every value 0-255 mixed with one color value
+
+    :param weight: How much of the color value to use (0 to 1)
+    :param color_value: One channel of the color
+    :returns: 256 mixed values (for bytes.translate)
+    """
+    return bytes(int(value * (1 - weight) + color_value * weight + 0.5) for value in range(256))
+
+
+def fade_rows(image: io.BytesIO, weights: typing.Sequence[float], color: Color = (0, 0, 0)) -> None:
+    """
+    Mix every row of an image with a color, by a different amount for each row
+
+    :param image: The bmp bytes
+    :param weights: How much of the color to use (0 to 1) for each row (weights[0] is the bottom row)
+    :param color: An (r, g, b) tuple for the color to fade to
+    :returns: None
+    """
+    header = _get_header(image)
+    if len(weights) != header.height:
+        raise ValueError("there must be one weight for each row")
+    color_values = (color[2], color[1], color[0])  # the order they're stored in
+    tables: dict[tuple[float, int], bytes] = {}  # rows with the same weight share tables
+
+    pixels = _read_pixel_area(image)
+    for y, weight in enumerate(weights):
+        start = header.row_size * y
+        stop = start + header.width * 3
+        for channel, color_value in enumerate(color_values):
+            key = (weight, color_value)
+            if key not in tables:
+                tables[key] = _mix_table(weight, color_value)
+            pixels[start + channel : stop : 3] = pixels[start + channel : stop : 3].translate(tables[key])
+    _write_pixel_area(image, pixels)
+
+
+def fade_columns(image: io.BytesIO, weights: typing.Sequence[float], color: Color = (0, 0, 0)) -> None:
+    """
+    Mix every column of an image with a color, by a different amount for each column
+
+    :param image: The bmp bytes
+    :param weights: How much of the color to use (0 to 1) for each column (weights[0] is the left column)
+    :param color: An (r, g, b) tuple for the color to fade to
+    :returns: None
+    """
+    header = _get_header(image)
+    if len(weights) != header.width:
+        raise ValueError("there must be one weight for each column")
+    keeps = [1 - weight for weight in weights]
+    # How much color gets added to each column, for each channel (in the order they're stored in)
+    adds = [[color_value * weight for weight in weights] for color_value in (color[2], color[1], color[0])]
+
+    pixels = _read_pixel_area(image)
+    for y in range(header.height):
+        start = header.row_size * y
+        stop = start + header.width * 3
+        for channel in range(3):
+            mixed = map(operator.add, map(operator.mul, pixels[start + channel : stop : 3], keeps), adds[channel])
+            pixels[start + channel : stop : 3] = bytes(map(int, map(operator.add, mixed, itertools.repeat(0.5))))
+    _write_pixel_area(image, pixels)
+
+
+def fade(image: io.BytesIO, color: Color = (0, 0, 0), *, vertical: bool = True, fade_in: bool = True, profile: Profile = linear) -> None:
+    """
+    Fade an image to or from a color. Fading in goes from all color at the
+    top (or left) to the untouched image at the bottom (or right); fading
+    out is the other way around.
+
+    :param image: The bmp bytes
+    :param color: An (r, g, b) tuple for the color to fade to or from
+    :param vertical: Whether to fade from top to bottom (otherwise left to right)
+    :param fade_in: Whether to fade in (otherwise out)
+    :param profile: Function from how far along the fade (0 to 1) to how faded in (or out) the image is (0 to 1)
+    :returns: None
+    """
+    header = _get_header(image)
+    weights = gradient_weights(header.height if vertical else header.width, profile)
+    if fade_in:
+        weights = [1 - weight for weight in weights]
+    if vertical:
+        weights.reverse()  # rows are stored bottom first
+        fade_rows(image, weights, color)
+    else:
+        fade_columns(image, weights, color)
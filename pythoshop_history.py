@@ -0,0 +1,225 @@
+"""PythoShop History
+
+Undo/redo for images. Rather than keeping a copy of the whole image after
+every change, only the rows that changed are kept (a full copy is only kept
+when the image changes size, e.g. after shrinking it).
+
+Each change is stored as "what to write to get back to the other version".
+Undoing a change writes those bytes into the image and keeps the bytes they
+replaced, which is exactly what redoing it will need. So undo and redo take
+time proportional to the number of changed bytes, not the size of the image.
+"""
+
+import collections
+import io
+import mmap
+import typing
+
+from pythoshop_exports import _get_header, invalidate_header, invalidate_stats
+
+# How much memory the history of each image may use before the oldest changes are forgotten
+HISTORY_BUDGET_BYTES = 256 * 1024 * 1024
+
+
+def _layout(image_bytes: typing.Union[bytes, mmap.mmap]) -> tuple[int, int, int]:
+    """
+    Helper function to get what decides where the rows of a bitmap are
+
+    :param image_bytes: The whole bitmap
+    :returns: (index of the first pixel, width, height)
+    """
+    return (
+        int.from_bytes(image_bytes[10:14], byteorder="little"),
+        int.from_bytes(image_bytes[18:22], byteorder="little"),
+        int.from_bytes(image_bytes[22:26], byteorder="little"),
+    )
+
+
+def _boundaries(image_bytes: typing.Union[bytes, mmap.mmap]) -> list[int]:
+    """
+    Helper function to split a bitmap into its header, each row, and anything after the rows
+
+    :param image_bytes: The whole bitmap
+    :returns: Indexes of where each part starts (and where the last one stops)
+    """
+    fpp, width, height = _layout(image_bytes)
+    row_size = (width * 3 + 3) // 4 * 4
+    if fpp > len(image_bytes) or height > len(image_bytes):
+        return [0, len(image_bytes)]  # not a bitmap we understand: treat it as one big part
+    boundaries = list(range(fpp, min(fpp + row_size * height, len(image_bytes)), row_size)) if row_size else []
+    return [0] + boundaries + [min(fpp + row_size * height, len(image_bytes)), len(image_bytes)]
+
+
+class Change:
+    """
+    One change to an image: either the changed parts (as (index, bytes)
+    runs) or, if the image changed size, a copy of the whole other version
+    """
+
+    __slots__ = ("runs", "snapshot")
+
+    def __init__(self, runs: typing.Optional[list[tuple[int, bytes]]] = None, snapshot: typing.Optional[bytes] = None) -> None:
+        self.runs = runs
+        self.snapshot = snapshot
+
+    @property
+    def size(self) -> int:
+        if self.snapshot is not None:
+            return len(self.snapshot)
+        return sum(len(data) for _, data in self.runs)
+
+    def apply(self, image: io.BytesIO) -> io.BytesIO:
+        """
+        Change an image to the other version (and remember the version it
+        was, so applying it again changes it back)
+
+        :param image: The bmp bytes
+        :returns: The changed image (a new one if it changed size)
+        """
+        if self.snapshot is not None:
+            other = io.BytesIO(self.snapshot)
+            self.snapshot = image.getvalue()
+            return other
+
+        for i, (start, data) in enumerate(self.runs):
+            image.seek(start)
+            replaced = image.read(len(data))
+            image.seek(start)
+            image.write(data)
+            self.runs[i] = (start, replaced)
+        invalidate_header(image)
+        invalidate_stats(image)
+        return image
+
+
+def diff(before: typing.Union[bytes, mmap.mmap], after: typing.Union[bytes, mmap.mmap]) -> typing.Optional[Change]:
+    """
+    Work out how to turn `after` back into `before`. Either can be the map of
+    a MappedBmp (see `MappedBmp.getmap`), which is compared a row at a time
+    rather than copied.
+
+    :param before: The whole bitmap before it was changed
+    :param after: The whole bitmap after it was changed
+    :returns: The change (or None if nothing changed)
+    """
+    if len(before) != len(after) or _layout(before) != _layout(after):
+        return Change(snapshot=before[:])
+
+    runs: list[tuple[int, bytes]] = []
+    run_start = run_stop = None
+    boundaries = _boundaries(after)
+    for start, stop in zip(boundaries, boundaries[1:]):
+        if before[start:stop] == after[start:stop]:
+            continue
+        if run_stop == start:
+            run_stop = stop  # touches the previous changed part, so make the run longer
+        else:
+            if run_start is not None:
+                runs.append((run_start, before[run_start:run_stop]))
+            run_start, run_stop = start, stop
+    if run_start is None:
+        return None
+    runs.append((run_start, before[run_start:run_stop]))
+    return Change(runs=runs)
+
+
+def diff_rows(image: io.BytesIO, before_rows: dict[int, bytes]) -> typing.Optional[Change]:
+    """
+    Work out how to turn an image back into what it was before some of its
+    rows were written to (see `pythoshop_exports.watch_writes`), without
+    looking at the rest of it
+
+    :param image: The bmp bytes (as they are now)
+    :param before_rows: What was in each row (including padding) before it was written to
+    :returns: The change (or None if nothing changed)
+    """
+    header = _get_header(image)
+    runs: list[tuple[int, list[bytes]]] = []
+    for y in sorted(before_rows):
+        start = header.fpp + header.row_size * y
+        image.seek(start)
+        if image.read(header.row_size) == before_rows[y]:
+            continue
+        if runs and runs[-1][0] + header.row_size * len(runs[-1][1]) == start:
+            runs[-1][1].append(before_rows[y])  # the row after the previous changed one, so make the run longer
+        else:
+            runs.append((start, [before_rows[y]]))
+    if not runs:
+        return None
+    return Change(runs=[(start, b"".join(rows)) for start, rows in runs])
+
+
+class History:
+    """
+    The changes made to one image, so they can be undone and redone
+    """
+
+    def __init__(self, budget_bytes: int = HISTORY_BUDGET_BYTES) -> None:
+        self.budget_bytes = budget_bytes
+        self.undo_changes: collections.deque[Change] = collections.deque()
+        self.redo_changes: list[Change] = []
+        self.size = 0  # bytes used by all of the remembered changes
+
+    def clear(self) -> None:
+        self.undo_changes.clear()
+        self.redo_changes.clear()
+        self.size = 0
+
+    def record(self, before: bytes, after: bytes) -> None:
+        """
+        Remember a change (forgetting anything that could be redone, and the
+        oldest changes if there isn't enough room)
+
+        :param before: The whole bitmap before it was changed
+        :param after: The whole bitmap after it was changed
+        :returns: None
+        """
+        self.add(diff(before, after))
+
+    def add(self, change: typing.Optional[Change]) -> None:
+        """
+        Remember a change made by `diff` (which can be worked out in the background)
+
+        :param change: The change (or None if nothing changed)
+        :returns: None
+        """
+        if change is None:
+            return
+        self.size -= sum(redo_change.size for redo_change in self.redo_changes)
+        self.redo_changes.clear()
+        self.undo_changes.append(change)
+        self.size += change.size
+        while self.size > self.budget_bytes and self.undo_changes:
+            self.size -= self.undo_changes.popleft().size
+
+    def can_undo(self) -> bool:
+        return bool(self.undo_changes)
+
+    def can_redo(self) -> bool:
+        return bool(self.redo_changes)
+
+    def _move(self, image: io.BytesIO, source: typing.MutableSequence[Change], destination: typing.MutableSequence[Change]) -> io.BytesIO:
+        change = source.pop()
+        self.size -= change.size
+        image = change.apply(image)
+        self.size += change.size
+        destination.append(change)
+        return image
+
+    def undo(self, image: io.BytesIO) -> io.BytesIO:
+        """
+        Undo the most recent change
+
+        :param image: The bmp bytes (as they are now)
+        :returns: The image as it was before the change (a new one if it changed size)
+        """
+        return self._move(image, self.undo_changes, self.redo_changes)
+
+    def redo(self, image: io.BytesIO) -> io.BytesIO:
+        """
+        Redo the most recently undone change
+
+        :param image: The bmp bytes (as they are now)
+        :returns: The image as it was after the change (a new one if it changed size)
+        """
+        return self._move(image, self.redo_changes, self.undo_changes)
@@ -0,0 +1,213 @@
+"""PythoShop Neighborhood
+
+Fast helpers for filters where a pixel's new color depends on the pixels
+around it: blurs, (separable) convolutions and edge detection for line
+drawings. Each channel is handled as a list of rows, and neighbors are
+found by shifting whole rows rather than looking them up one at a time.
+"""
+
+import io
+import itertools
+import operator
+import typing
+
+from pythoshop_exports import BmpHeader, _get_header, _read_pixel_area, _write_pixel_area
+
+Color = tuple[int, int, int]
+Plane = list[bytes]  # one channel of an image: a bytes object (one value per pixel) for each row
+
+
+def _read_planes(image: io.BytesIO) -> tuple[BmpHeader, bytearray, list[Plane]]:
+    """
+    Helper function to split an image into its red, green and blue planes
+
+    :param image: The bmp bytes
+    :returns: The header, the raw pixel area, and the [red, green, blue] planes
+    """
+    header = _get_header(image)
+    pixels = _read_pixel_area(image)
+    planes: list[Plane] = [[], [], []]
+    for y in range(header.height):
+        start = header.row_size * y
+        stop = start + header.width * 3
+        planes[0].append(bytes(pixels[start + 2 : stop : 3]))
+        planes[1].append(bytes(pixels[start + 1 : stop : 3]))
+        planes[2].append(bytes(pixels[start:stop:3]))
+    return header, pixels, planes
+
+
+def _write_planes(image: io.BytesIO, header: BmpHeader, pixels: bytearray, planes: list[Plane]) -> None:
+    """
+    Helper function to put [red, green, blue] planes back into an image
+
+    :param image: The bmp bytes
+    :param header: The header of the image
+    :param pixels: The raw pixel area the planes were read from
+    :param planes: The new [red, green, blue] planes
+    :returns: None
+    """
+    for y in range(header.height):
+        start = header.row_size * y
+        stop = start + header.width * 3
+        pixels[start + 2 : stop : 3] = planes[0][y]
+        pixels[start + 1 : stop : 3] = planes[1][y]
+        pixels[start:stop:3] = planes[2][y]
+    _write_pixel_area(image, pixels)
+
+
+def _to_bytes(values: typing.Iterable[float]) -> bytes:
+    """
+    Helper function to round values (halves go up) and limit them to 0-255
+
+    :param values: The values
+    :returns: The values as bytes
+    """
+    rounded = map(int, map(operator.add, values, itertools.repeat(0.5)))
+    return bytes(map(max, map(min, rounded, itertools.repeat(255)), itertools.repeat(0)))
+
+
+def _shifted(values: typing.Sequence, radius: int) -> list:
+    """
+    Helper function to add copies of the first and last value to each end so
+    every value has `radius` neighbors on each side
+
+    :param values: The values
+    :param radius: How many neighbors are needed on each side
+    :returns: The values with copies of the ends added
+    """
+    return [values[0]] * radius + list(values) + [values[-1]] * radius
+
+
+def box_kernel(radius: int) -> list[float]:
+    """
+    Get a 1-D kernel that averages a pixel with `radius` pixels on each side
+
+    :param radius: How many neighbors to use on each side
+    :returns: The kernel weights
+    """
+    return [1 / (2 * radius + 1)] * (2 * radius + 1)
+
+
+def convolve_separable(image: io.BytesIO, kernel_x: typing.Sequence[float], kernel_y: typing.Optional[typing.Sequence[float]] = None) -> None:
+    """
+    Apply a separable convolution: every pixel becomes a weighted sum of the
+    pixels in its row (kernel_x) and then of the pixels in its column
+    (kernel_y). Pixels past the edges are treated as copies of the edge.
+
+    :param image: The bmp bytes
+    :param kernel_x: Weights for the row (an odd number of them; the middle one is for the pixel itself)
+    :param kernel_y: Weights for the column (same as kernel_x if None)
+    :returns: None
+    """
+    if kernel_y is None:
+        kernel_y = kernel_x
+    if len(kernel_x) % 2 == 0 or len(kernel_y) % 2 == 0:
+        raise ValueError("kernels need an odd number of weights")
+    radius_x = len(kernel_x) // 2
+    radius_y = len(kernel_y) // 2
+
+    header, pixels, planes = _read_planes(image)
+    for channel, plane in enumerate(planes):
+        across: list[list[float]] = []
+        for row in plane:
+            padded = _shifted(row, radius_x)
+            total: typing.Iterable[float] = itertools.repeat(0.0, header.width)
+            for tap, weight in enumerate(kernel_x):
+                total = map(operator.add, total, map(operator.mul, padded[tap : tap + header.width], itertools.repeat(weight)))
+            across.append(list(total))
+
+        padded_rows = _shifted(across, radius_y)
+        new_plane = []
+        for y in range(header.height):
+            total = itertools.repeat(0.0, header.width)
+            for tap, weight in enumerate(kernel_y):
+                total = map(operator.add, total, map(operator.mul, padded_rows[y + tap], itertools.repeat(weight)))
+            new_plane.append(_to_bytes(total))
+        planes[channel] = new_plane
+    _write_planes(image, header, pixels, planes)
+
+
+def box_blur(image: io.BytesIO, radius: int) -> None:
+    """
+    Blur an image by making every pixel the average of the square of pixels
+    up to `radius` away from it (fewer near the edges). Uses an "integral
+    image", so it is just as fast for big radiuses as for small ones.
+
+    :param image: The bmp bytes
+    :param radius: How far away pixels can be and still be part of the average
+    :returns: None
+    """
+    header, pixels, planes = _read_planes(image)
+    width, height = header.width, header.height
+    # Columns of the square around each x (the ends of the range, and how many columns it has)
+    lefts = [max(0, x - radius) for x in range(width)]
+    rights = [min(width, x + radius + 1) for x in range(width)]
+    columns = list(map(operator.sub, rights, lefts))
+
+    for channel, plane in enumerate(planes):
+        # sums[y][x] is the total of every value below row y and left of column x
+        sums = [[0] * (width + 1)]
+        for row in plane:
+            sums.append(list(map(operator.add, sums[-1], itertools.chain((0,), itertools.accumulate(row)))))
+
+        new_plane = []
+        for y in range(height):
+            bottom = max(0, y - radius)
+            top = min(height, y + radius + 1)
+            strip = list(map(operator.sub, sums[top], sums[bottom]))  # totals of the rows in the square
+            totals = map(operator.sub, map(strip.__getitem__, rights), map(strip.__getitem__, lefts))
+            counts = list(map(operator.mul, columns, itertools.repeat(top - bottom)))
+            # total / count, rounded with halves going up: (2 * total + count) // (2 * count)
+            doubled_totals = map(operator.mul, totals, itertools.repeat(2))
+            doubled_counts = map(operator.mul, counts, itertools.repeat(2))
+            new_plane.append(bytes(map(operator.floordiv, map(operator.add, doubled_totals, counts), doubled_counts)))
+        planes[channel] = new_plane
+    _write_planes(image, header, pixels, planes)
+
+
+def edge_map(
+    image: io.BytesIO,
+    tolerance: float,
+    edge_color: Color = (0, 0, 0),
+    background_color: Color = (255, 255, 255),
+    *,
+    keep_border: bool = True,
+) -> None:
+    """
+    Turn an image into a line drawing. A pixel is an edge if its brightness
+    (average of r, g and b) is more than `tolerance` away from the pixel to
+    its right or the pixel above it.
+
+    The last column and top row don't have both neighbors. With keep_border
+    they are left as they were; otherwise they are compared with the one
+    neighbor they do have (and the top right corner is never an edge).
+
+    :param image: The bmp bytes
+    :param tolerance: How different the brightness must be to count as an edge
+    :param edge_color: An (r, g, b) tuple for edges
+    :param background_color: An (r, g, b) tuple for everything else
+    :param keep_border: Whether to leave the last column and top row unchanged
+    :returns: None
+    """
+    header, pixels, planes = _read_planes(image)
+    width, height = header.width, header.height
+    # (r + g + b) / 3 exactly like a pixel at a time would work it out, so rounding gives the same edges
+    brightnesses = [
+        list(map(operator.truediv, map(operator.add, map(operator.add, reds, greens), blues), itertools.repeat(3))) for reds, greens, blues in zip(*planes)
+    ]
+    # Tables to turn 0 (background) / 1 (edge) into each channel of the color
+    tables = [bytes((background_color[channel], edge_color[channel])).ljust(256, b"\0") for channel in range(3)]
+
+    last_row = height - 1 if keep_border else height
+    last_column = width - 1 if keep_border else width
+    for y in range(last_row):
+        row = brightnesses[y]
+        edges = list(map(operator.gt, map(abs, map(operator.sub, row[:-1], row[1:])), itertools.repeat(tolerance)))
+        edges.append(False)  # nothing to the right of the last column
+        if y + 1 < height:
+            above = map(operator.gt, map(abs, map(operator.sub, row, brightnesses[y + 1])), itertools.repeat(tolerance))
+            edges = list(map(operator.or_, edges, above))
+        mask = bytes(edges[:last_column])
+        for channel in range(3):
+            planes[channel][y] = mask.translate(tables[channel]) + planes[channel][y][last_column:]
+    _write_planes(image, header, pixels, planes)
@@ -0,0 +1,156 @@
+"""PythoShop Noise
+
+Fast helpers for "static" filters that give every pixel random values. All
+of the random values are made at once instead of calling `random` for
+each pixel.
+
+By default the values are exactly the ones that calling
+`random.randint(low, high)` over and over would give (so `random.seed(0)`
+still makes the same picture as a filter that sets one pixel at a time).
+With `compatible=False` they come from `random.randbytes`, which is faster
+but gives different values.
+"""
+
+import io
+import itertools
+import random
+import typing
+
+from pythoshop_exports import _get_header, _read_pixel_area, _write_pixel_area
+
+Color = tuple[int, int, int]
+
+
+def randint_bytes(count: int, low: int = 0, high: int = 255, rng: typing.Optional[random.Random] = None) -> bytes:
+    """
+    Get `count` random values between low and high (both included), exactly
+    as if `rng.randint(low, high)` had been called `count` times.
+
+    randint works by taking the top bits of a 32 bit random number and
+    trying again if they are too big. This does the same thing to a big
+    batch of 32 bit numbers from a single `getrandbits` call (only the top
+    byte or two of each number matter, so no number is ever looked at on
+    its own).
+
+    :param count: How many values are needed
+    :param low: The smallest possible value (at least 0)
+    :param high: The biggest possible value (at most 255)
+    :param rng: The random number generator to use (the `random` module's if None)
+    :returns: The values
+    """
+    if not 0 <= low <= high <= 255:
+        raise ValueError("values must be between 0 and 255")
+    num_choices = high - low + 1
+    num_bits = num_choices.bit_length()  # randint asks for this many bits each time
+    getrandbits = (rng or random).getrandbits
+    if num_bits <= 8:
+        # The value is the top num_bits of the top byte; top bytes that are too big are tries that failed
+        shift = 8 - num_bits
+        table = bytes(low + (top >> shift) if top < num_choices << shift else 0 for top in range(256))
+        failed = bytes(range(num_choices << shift, 256))
+    else:
+        # Only 0-255 needs 9 bits: a try fails when the top bit is set, otherwise the value is the next 8 bits
+        worked = bytes(top < 128 for top in range(256))
+
+    values = bytearray()
+    while len(values) < count:
+        # Each 32 bit number gives at most one value, so never take more than are still needed
+        num_words = count - len(values)
+        bits = getrandbits(32 * num_words)
+        tops = bits.to_bytes(4 * num_words, "little")[3::4]  # the first number is the lowest 32 bits
+        if num_bits <= 8:
+            values += tops.translate(table, failed)
+        else:
+            # Shifting everything left by one bit moves the next 8 bits of each number into its top byte
+            # (the bit that moves into the next number only reaches its lowest byte)
+            shifted_tops = (bits << 1).to_bytes(4 * num_words + 1, "little")[3::4]
+            values += bytes(itertools.compress(shifted_tops, tops.translate(worked)))
+    return bytes(values)
+
+
+def randbytes(count: int, low: int = 0, high: int = 255, rng: typing.Optional[random.Random] = None) -> bytes:
+    """
+    Get `count` random values between low and high (both included) as fast
+    as possible. The values are *not* the same as randint would give.
+
+    :param count: How many values are needed
+    :param low: The smallest possible value (at least 0)
+    :param high: The biggest possible value (at most 255)
+    :param rng: The random number generator to use (the `random` module's if None)
+    :returns: The values
+    """
+    if not 0 <= low <= high <= 255:
+        raise ValueError("values must be between 0 and 255")
+    values = (rng or random).randbytes(count)
+    if (low, high) != (0, 255):
+        values = values.translate(bytes(low + value * (high - low + 1) // 256 for value in range(256)))
+    return values
+
+
+def noise_planes(
+    width: int,
+    height: int,
+    num_planes: int = 3,
+    low: int = 0,
+    high: int = 255,
+    *,
+    order: str = "xy",
+    compatible: bool = True,
+) -> list[list[bytes]]:
+    """
+    Get random values for every pixel of an image. Each pixel gets
+    `num_planes` values in a row (e.g. r, g then b), and the pixels are
+    visited in the order a pair of loops would visit them: "xy" is
+    `for x in range(width): for y in range(height)`, "yx" is the other way.
+
+    :param width: Width of the image
+    :param height: Height of the image
+    :param num_planes: How many values each pixel gets
+    :param low: The smallest possible value
+    :param high: The biggest possible value
+    :param order: "xy" (x is the outer loop) or "yx" (y is the outer loop)
+    :param compatible: Whether to give the same values as calling random.randint for each value
+    :returns: For each plane, the values of each row (row 0 is the bottom row)
+    """
+    if order not in ("xy", "yx"):
+        raise ValueError('order must be "xy" or "yx"')
+    values = (randint_bytes if compatible else randbytes)(width * height * num_planes, low, high)
+    planes = []
+    for plane in range(num_planes):
+        plane_values = values[plane::num_planes]
+        if order == "xy":
+            planes.append([plane_values[y::height] for y in range(height)])
+        else:
+            planes.append([plane_values[y * width : (y + 1) * width] for y in range(height)])
+    return planes
+
+
+def static(image: io.BytesIO, color: typing.Optional[Color] = None, *, order: str = "xy", compatible: bool = True) -> None:
+    """
+    Fill an image with random static. Without a color, every pixel gets a
+    random r, g and b (in that order). With a color, every pixel gets one
+    random brightness and becomes that fraction of the color
+    (`int(color * brightness / 255 + 0.5)`).
+
+    :param image: The bmp bytes
+    :param color: An (r, g, b) tuple to tint the static with (or None for colorful static)
+    :param order: "xy" (x is the outer loop) or "yx" (y is the outer loop)
+    :param compatible: Whether to give the same picture as calling random.randint for each value
+    :returns: None
+    """
+    header = _get_header(image)
+    if color is None:
+        reds, greens, blues = noise_planes(header.width, header.height, 3, order=order, compatible=compatible)
+    else:
+        (brightnesses,) = noise_planes(header.width, header.height, 1, order=order, compatible=compatible)
+        tables = [bytes(int(value * brightness / 255 + 0.5) for brightness in range(256)) for value in color]
+        reds, greens, blues = ([row.translate(table) for row in brightnesses] for table in tables)
+
+    pixels = _read_pixel_area(image)
+    for y in range(header.height):
+        start = header.row_size * y
+        stop = start + header.width * 3
+        pixels[start:stop:3] = blues[y]
+        pixels[start + 1 : stop : 3] = greens[y]
+        pixels[start + 2 : stop : 3] = reds[y]
+    _write_pixel_area(image, pixels)
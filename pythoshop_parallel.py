@@ -0,0 +1,186 @@
+"""PythoShop Parallel
+
+Runs filters exported with `@export_filter(parallel=True)` on several
+processes at once. The pixels are put in shared memory and each process
+runs the filter on one horizontal band of rows, so no pixel data has to be
+copied between processes.
+
+Each band looks like a complete (shorter) bitmap to the filter, so only
+filters where every pixel depends on nothing but itself can be run this way
+(no neighboring pixels). Filters given a secondary image are run normally.
+"""
+
+import concurrent.futures
+import importlib.util
+import io
+import multiprocessing
+import os
+import typing
+from multiprocessing import shared_memory
+
+from pythoshop_exports import _count_write, _get_header, will_write_rows
+
+# Images with fewer pixels than this aren't worth starting other processes for
+PARALLEL_MIN_PIXELS = 512 * 512
+
+_executor: typing.Optional[concurrent.futures.ProcessPoolExecutor] = None
+_loaded_modules: dict[str, typing.Any] = {}
+
+
+def _get_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # Filters run on a background thread of the (multithreaded) GUI, where forking could
+        # deadlock, so the worker processes are started from scratch instead
+        _executor = concurrent.futures.ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+class _BandImage:
+    """
+    File-like view of some of the rows of a bitmap in shared memory. The
+    header is a private copy (changed so the band's rows are the whole image)
+    while the pixel bytes are shared with all the other processes.
+    """
+
+    __slots__ = ("_header", "_buffer", "_position", "__weakref__")
+
+    def __init__(self, header: bytes, buffer: memoryview) -> None:
+        self._header = bytearray(header)
+        self._buffer = buffer
+        self._position = 0
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = offset
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def read(self, size: typing.Optional[int] = -1) -> bytes:
+        start = self._position
+        stop = len(self._buffer) if size is None or size < 0 else min(start + size, len(self._buffer))
+        data = b""
+        if start < len(self._header):
+            data = bytes(self._header[start : min(stop, len(self._header))])
+            start = len(self._header)
+        if start < stop:
+            data += bytes(self._buffer[start:stop])
+        self._position = max(stop, self._position)
+        return data
+
+    def write(self, data: bytes) -> int:
+        written = len(data)
+        start = self._position
+        stop = start + written
+        if stop > len(self._buffer):
+            raise ValueError("can't make an image bigger while running it in parallel")
+        if start < len(self._header):
+            in_header = min(stop, len(self._header)) - start
+            self._header[start : start + in_header] = data[:in_header]
+            data = data[in_header:]
+            start += in_header
+        self._buffer[start:stop] = data
+        self._position = stop
+        return written
+
+    def getbuffer(self) -> memoryview:
+        return self._buffer
+
+    def close(self) -> None:
+        self._buffer.release()
+
+
+def _load_function(source_path: str, function_name: str) -> typing.Callable:
+    """
+    Load a filter in a worker process (the module is only loaded once per process)
+
+    :param source_path: Path to the python file the filter is in
+    :param function_name: Name of the filter
+    :returns: The undecorated filter function
+    """
+    key = source_path + "@" + str(os.stat(source_path).st_mtime_ns)  # reload the file if it has been edited
+    if key not in _loaded_modules:
+        module_name = os.path.splitext(os.path.basename(source_path))[0]
+        spec = importlib.util.spec_from_file_location(module_name, source_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _loaded_modules[key] = module
+    func = getattr(_loaded_modules[key], function_name)
+    return getattr(func, "__wrapped__", func)
+
+
+def _run_band(source_path: str, function_name: str, memory_name: str, header: bytes, size: int, kwargs: dict) -> None:
+    """
+    Run a filter on one band of an image (this is what each worker process does)
+
+    :param source_path: Path to the python file the filter is in
+    :param function_name: Name of the filter
+    :param memory_name: Name of the shared memory holding the image
+    :param header: The header of the band (as if it were the whole image)
+    :param size: How many bytes of the shared memory are the image
+    :param kwargs: Keyword arguments for the filter
+    :returns: None
+    """
+    func = _load_function(source_path, function_name)
+    try:
+        memory = shared_memory.SharedMemory(name=memory_name, track=False)  # only the creator cleans it up (Python 3.13+)
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=memory_name)
+    band = _BandImage(header, memory.buf[:size])
+    try:
+        if func(band, **kwargs) is not None:
+            raise Exception("Function " + function_name + " runs in parallel so it must change the image rather than return a new one")
+    finally:
+        band.close()
+        memory.close()
+
+
+def run_in_bands(func: typing.Callable, image: io.BytesIO, **kwargs) -> None:
+    """
+    Run a filter on an image by splitting it into bands of rows and running
+    each band on a different process. Small images (and filters given a
+    secondary image) are just run normally.
+
+    :param func: The (undecorated) filter to run
+    :param image: The bmp bytes
+    :returns: None
+    """
+    header = _get_header(image)
+    num_bands = min(os.cpu_count() or 1, header.height)
+    if num_bands < 2 or header.width * header.height < PARALLEL_MIN_PIXELS:
+        return func(image, **kwargs)
+    if kwargs.get("other_image") is not None:
+        return func(image, **kwargs)  # a band's rows don't line up with the rows of the secondary image
+    image.seek(0)
+    original_header = image.read(header.fpp)
+    size = header.fpp + header.row_size * header.height
+    memory = shared_memory.SharedMemory(create=True, size=size)
+    try:
+        memory.buf[: header.fpp] = original_header
+        memory.buf[header.fpp : size] = image.read(size - header.fpp)
+
+        futures = []
+        for band in range(num_bands):
+            first_row = header.height * band // num_bands
+            last_row = header.height * (band + 1) // num_bands
+            band_header = bytearray(original_header)
+            band_header[10:14] = (header.fpp + first_row * header.row_size).to_bytes(length=4, byteorder="little")
+            band_header[22:26] = (last_row - first_row).to_bytes(length=4, byteorder="little")
+            futures.append(
+                _get_executor().submit(_run_band, func.__code__.co_filename, func.__name__, memory.name, bytes(band_header), size, kwargs)
+            )
+        for future in futures:
+            future.result()
+
+        will_write_rows(image, 0, header.height - 1)
+        image.seek(header.fpp)
+        image.write(memory.buf[header.fpp : size])
+        _count_write("write all pixels", size - header.fpp, header.width * header.height)
+    finally:
+        memory.close()
+        memory.unlink()
@@ -0,0 +1,114 @@
+"""PythoShop Quantize
+
+Fast helpers for "tone" filters that turn every pixel into one of a few
+colors (a palette). Pixels can be picked by how bright they are (two tone,
+four tone, n tone) or by which palette color they are closest to.
+"""
+
+import bisect
+import functools
+import io
+import operator
+import typing
+
+from pythoshop_exports import _get_header, _pixel_spans, _read_pixel_area, _write_pixel_area, map_colors
+
+Color = tuple[int, int, int]
+
+
+def even_thresholds(num_tones: int) -> list[float]:
+    """
+    Get brightness thresholds that split 0-255 into equally sized parts
+
+    :param num_tones: How many parts (tones) there should be
+    :returns: The num_tones - 1 brightnesses where one tone changes to the next
+    """
+    if num_tones < 1:
+        raise ValueError("there must be at least 1 tone")
+    return [256 * tone / num_tones for tone in range(1, num_tones)]
+
+
+@functools.lru_cache(maxsize=32)
+def _tone_table(thresholds: tuple[float, ...]) -> bytes:
+    """
+    Helper function to find the tone for every possible r + g + b total
+
+    :param thresholds: Brightnesses (in increasing order) where one tone changes to the next
+    :returns: 766 tone numbers (one for each total from 0 to 255 * 3)
+    """
+    return bytes(bisect.bisect_right(thresholds, total / 3) for total in range(766))
+
+
+def threshold_tones(image: io.BytesIO, thresholds: typing.Sequence[float], palette: typing.Sequence[Color]) -> None:
+    """
+    Change every pixel to a palette color based on its brightness (the
+    average of r, g and b). Pixels darker than thresholds[0] become
+    palette[0], ones at least thresholds[0] but darker than thresholds[1]
+    become palette[1], and so on.
+
+    :param image: The bmp bytes
+    :param thresholds: Brightnesses (in increasing order) where one tone changes to the next
+    :param palette: One (r, g, b) color for each tone (one more than the number of thresholds)
+    :returns: None
+    """
+    if len(palette) > 256:
+        raise ValueError("a palette can have at most 256 colors")
+    if len(palette) != len(thresholds) + 1:
+        raise ValueError("there should be one more color in the palette than there are thresholds")
+    if list(thresholds) != sorted(thresholds):
+        raise ValueError("the thresholds must be in increasing order")
+
+    tones = _tone_table(tuple(thresholds))
+    # Tables to turn a tone number into each channel of its color
+    blues = bytes(color[2] for color in palette).ljust(256, b"\0")
+    greens = bytes(color[1] for color in palette).ljust(256, b"\0")
+    reds = bytes(color[0] for color in palette).ljust(256, b"\0")
+
+    pixels = _read_pixel_area(image)
+    for start, stop in _pixel_spans(_get_header(image)):
+        totals = map(operator.add, map(operator.add, pixels[start:stop:3], pixels[start + 1 : stop : 3]), pixels[start + 2 : stop : 3])
+        row_tones = bytes(map(tones.__getitem__, totals))
+        pixels[start:stop:3] = row_tones.translate(blues)
+        pixels[start + 1 : stop : 3] = row_tones.translate(greens)
+        pixels[start + 2 : stop : 3] = row_tones.translate(reds)
+    _write_pixel_area(image, pixels)
+
+
+def n_tones(image: io.BytesIO, palette: typing.Sequence[Color]) -> None:
+    """
+    Change every pixel to one of the palette colors, splitting brightness
+    into equally sized parts (palette[0] for the darkest pixels)
+
+    :param image: The bmp bytes
+    :param palette: One (r, g, b) color for each tone
+    :returns: None
+    """
+    threshold_tones(image, even_thresholds(len(palette)), palette)
+
+
+@functools.lru_cache(maxsize=65536)
+def nearest_palette_index(color: Color, palette: tuple[Color, ...]) -> int:
+    """
+    Find which palette color is closest to a color (straight-line distance
+    between the r, g, b values). Results are remembered, so looking up the
+    same color again is fast.
+
+    :param color: An (r, g, b) tuple
+    :param palette: The (r, g, b) colors to choose from
+    :returns: The index of the closest palette color (the first one if there's a tie)
+    """
+    distances = [(color[0] - r) ** 2 + (color[1] - g) ** 2 + (color[2] - b) ** 2 for r, g, b in palette]
+    return distances.index(min(distances))
+
+
+def nearest_tones(image: io.BytesIO, palette: typing.Sequence[Color]) -> None:
+    """
+    Change every pixel to whichever palette color it is closest to. The
+    distance is only worked out once for each different color in the image.
+
+    :param image: The bmp bytes
+    :param palette: The (r, g, b) colors to choose from
+    :returns: None
+    """
+    palette = tuple(tuple(color) for color in palette)
+    map_colors(image, lambda color: palette[nearest_palette_index(color, palette)])
@@ -0,0 +1,140 @@
+"""PythoShop Transform
+
+Fast geometric transforms (resizing, mirroring, flipping) for filters.
+Every transform is a mapping "the pixel at (x, y) of the new image comes
+from the pixel at (f(x), g(y)) of the old image". The mapping is worked
+out once for each combination of transform and image sizes (and
+remembered), then the new image is built a whole row at a time.
+"""
+
+import array
+import functools
+import io
+import typing
+
+from pythoshop_exports import _get_header, _read_pixel_area, _write_pixel_area, create_bmp
+
+# For each transform: (source size, destination size) -> (source x for each x, source y for each y)
+_OPERATIONS: dict[str, typing.Callable[[tuple[int, int], tuple[int, int]], tuple[list[int], list[int]]]] = {
+    "resize": lambda source, destination: (
+        [x * source[0] // destination[0] for x in range(destination[0])],
+        [y * source[1] // destination[1] for y in range(destination[1])],
+    ),
+    "flip_horizontal": lambda source, destination: (
+        [source[0] - 1 - x for x in range(source[0])],
+        list(range(source[1])),
+    ),
+    "flip_vertical": lambda source, destination: (
+        list(range(source[0])),
+        [source[1] - 1 - y for y in range(source[1])],
+    ),
+    "rotate_180": lambda source, destination: (
+        [source[0] - 1 - x for x in range(source[0])],
+        [source[1] - 1 - y for y in range(source[1])],
+    ),
+    "mirror_horizontal_left": lambda source, destination: (
+        [min(x, source[0] - 1 - x) for x in range(source[0])],
+        list(range(source[1])),
+    ),
+    "mirror_horizontal_right": lambda source, destination: (
+        [max(x, source[0] - 1 - x) for x in range(source[0])],
+        list(range(source[1])),
+    ),
+    "mirror_vertical_top": lambda source, destination: (
+        list(range(source[0])),
+        [max(y, source[1] - 1 - y) for y in range(source[1])],  # y = 0 is the bottom row
+    ),
+    "mirror_vertical_bottom": lambda source, destination: (
+        list(range(source[0])),
+        [min(y, source[1] - 1 - y) for y in range(source[1])],
+    ),
+}
+
+
+@functools.lru_cache(maxsize=16)
+def _get_index_map(operation: str, source_size: tuple[int, int], destination_size: tuple[int, int]) -> tuple[tuple[int, ...], array.array]:
+    """
+    Work out where every pixel of the new image comes from (remembered for
+    the most recently used transforms and sizes)
+
+    :param operation: Name of the transform
+    :param source_size: (width, height) of the original image
+    :param destination_size: (width, height) of the new image
+    :returns: The source row for each new row, and the source byte (within a row) for each byte of a new row
+    """
+    x_map, y_map = _OPERATIONS[operation](source_size, destination_size)
+    byte_map = array.array("I", (x * 3 + channel for x in x_map for channel in range(3)))
+    return tuple(y_map), byte_map
+
+
+def apply_transform(image: io.BytesIO, operation: str, width: typing.Optional[int] = None, height: typing.Optional[int] = None) -> io.BytesIO:
+    """
+    Create a transformed copy of an image. Possible transforms are "resize"
+    (which needs a width and height), "flip_horizontal", "flip_vertical",
+    "rotate_180", "mirror_horizontal_left", "mirror_horizontal_right",
+    "mirror_vertical_top" and "mirror_vertical_bottom".
+
+    :param image: The bmp bytes
+    :param operation: Name of the transform
+    :param width: Width of the new image (only for "resize")
+    :param height: Height of the new image (only for "resize")
+    :returns: A new image
+    """
+    if operation not in _OPERATIONS:
+        raise ValueError('"' + operation + '" is not a transform. Try one of: ' + ", ".join(_OPERATIONS))
+    header = _get_header(image)
+    source_size = (header.width, header.height)
+    destination_size = (width or header.width, height or header.height) if operation == "resize" else source_size
+    if destination_size[0] < 1 or destination_size[1] < 1:
+        raise ValueError("the new image must be at least 1 pixel wide and tall")
+
+    y_map, byte_map = _get_index_map(operation, source_size, destination_size)
+    source = bytes(_read_pixel_area(image))
+    destination = create_bmp(*destination_size)
+    padding = bytes(_get_header(destination).padding)
+
+    rows = []
+    previous_y = None
+    for source_y in y_map:
+        if source_y != previous_y:  # rows that come from the same source row are only built once
+            start = header.row_size * source_y
+            source_row = source[start : start + header.row_size]
+            row = bytes(map(source_row.__getitem__, byte_map)) + padding
+            previous_y = source_y
+        rows.append(row)
+    _write_pixel_area(destination, b"".join(rows))
+    return destination
+
+
+def resize(image: io.BytesIO, width: int, height: int) -> io.BytesIO:
+    """
+    Create a copy of an image with a different size (using the nearest pixel)
+
+    :param image: The bmp bytes
+    :param width: Width of the new image
+    :param height: Height of the new image
+    :returns: A new image
+    """
+    return apply_transform(image, "resize", width, height)
+
+
+def shrink(image: io.BytesIO) -> io.BytesIO:
+    """
+    Create a copy of an image that is half as wide and half as tall
+
+    :param image: The bmp bytes
+    :returns: A new image
+    """
+    header = _get_header(image)
+    return resize(image, max(header.width // 2, 1), max(header.height // 2, 1))
+
+
+def enlarge(image: io.BytesIO) -> io.BytesIO:
+    """
+    Create a copy of an image that is twice as wide and twice as tall
+
+    :param image: The bmp bytes
+    :returns: A new image
+    """
+    header = _get_header(image)
+    return resize(image, header.width * 2, header.height * 2)
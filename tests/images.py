@@ -0,0 +1,32 @@
+"""
+Synthetic images for the regression tests of the pythoshop_* helpers
+"""
+
+import io
+import random
+
+from pythoshop_exports import create_bmp, set_pixel_rgb
+
+# Widths with 0, 3, 2 and 1 padding bytes at the end of each row
+SIZES = [(4, 3), (5, 4), (6, 2), (7, 5)]
+
+
+def random_image(width: int, height: int, seed: int) -> io.BytesIO:
+    """
+    Make an image with a (predictably) random color in every pixel
+
+    :param width: Width of the image
+    :param height: Height of the image
+    :param seed: Seed for the random colors
+    :returns: The bmp bytes
+    """
+    rng = random.Random(seed)
+    image = create_bmp(width, height)
+    for x in range(width):
+        for y in range(height):
+            set_pixel_rgb(image, (x, y), (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255)))
+    return image
+
+
+def copy_image(image: io.BytesIO) -> io.BytesIO:
+    return io.BytesIO(image.getvalue())
@@ -9,6 +9,7 @@ import tempfile
 import typing
 import unittest
 
+import pythoshop_exports
 import tests.config as config
 
 
@@ -115,6 +116,9 @@ class TestBase:
                         image_file.write(self.original_images[orig_file_name])
                         try:
                             static_manip_func(image_file, **self.test_parameters)
+                            stats = pythoshop_exports.get_last_stats()
+                            if stats is not None:
+                                print(stats.report())
                         except Exception as e:
                             self.assertTrue(False, "Running on " + orig_file_name + " caused an exception: " + str(e))
                         first_pixel_index = int.from_bytes(self.solution_images[test_file_name][10:14], "little")
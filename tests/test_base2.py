@@ -4,6 +4,7 @@ import random
 import signal
 import tempfile
 
+import pythoshop_exports
 import tests.test_base as test_base
 
 
@@ -59,6 +60,9 @@ class TestBase2(test_base.TestBase):
                         image2.write(self.original_images[image2_file_name])
                         try:
                             result = static_manip_func(image1, image2, **self.test_parameters)
+                            stats = pythoshop_exports.get_last_stats()
+                            if stats is not None:
+                                print(stats.report())
                         except Exception as e:
                             self.assertTrue(False, "Running on " + image1_file_name + " and " + image2_file_name + " casused an exception: " + str(e))
                         first_pixel_index = int.from_bytes(self.solution_images[test_file_name][10:14], "little")
@@ -0,0 +1,104 @@
+"""
+Regression tests for pythoshop_colorspace: planes must hold the same numbers
+as converting each pixel with colorsys, and writing them back must change an
+image like a get_pixel_rgb/set_pixel_rgb loop would
+"""
+
+import colorsys
+import unittest
+
+import pythoshop_colorspace
+from pythoshop_exports import get_pixel_rgb, set_pixel_rgb
+from tests.images import SIZES, copy_image, random_image
+
+
+def _hsl_from_rgb(r, g, b):
+    h, l, s = colorsys.rgb_to_hls(r, g, b)
+    return h, s, l
+
+
+def _rgb_from_hsl(h, s, l):
+    return colorsys.hls_to_rgb(h, l, s)
+
+
+# Space name -> (conversion from r, g, b, conversion back to r, g, b)
+SPACES = {"hsv": (colorsys.rgb_to_hsv, colorsys.hsv_to_rgb), "hsl": (_hsl_from_rgb, _rgb_from_hsl)}
+
+
+def _to_byte(value):
+    return int(value * 255 + 0.5)
+
+
+class TestPlanes(unittest.TestCase):
+    def test_to_planes(self):
+        for space, (from_rgb, _) in SPACES.items():
+            for width, height in SIZES:
+                with self.subTest(space=space, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    planes = pythoshop_colorspace.to_planes(image, space)
+                    for x in range(width):
+                        for y in range(height):
+                            r, g, b = get_pixel_rgb(image, (x, y))
+                            expected = from_rgb(r / 255, g / 255, b / 255)
+                            self.assertEqual(tuple(plane[y * width + x] for plane in planes), expected)
+
+    def test_round_trip(self):
+        for space in SPACES:
+            for width, height in SIZES:
+                with self.subTest(space=space, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    original = image.getvalue()
+                    pythoshop_colorspace.from_planes(image, pythoshop_colorspace.to_planes(image, space), space)
+                    self.assertEqual(image.getvalue(), original)
+
+    def test_from_planes(self):
+        for space, (_, to_rgb) in SPACES.items():
+            for width, height in SIZES:
+                with self.subTest(space=space, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    planes = pythoshop_colorspace.to_planes(random_image(width, height, seed=width + 1), space)
+                    planes = ([(h + 0.3) % 1.0 for h in planes[0]], [s / 2 for s in planes[1]], planes[2])
+                    expected = copy_image(image)
+                    for x in range(width):
+                        for y in range(height):
+                            r, g, b = to_rgb(*(plane[y * width + x] for plane in planes))
+                            set_pixel_rgb(expected, (x, y), (_to_byte(r), _to_byte(g), _to_byte(b)))
+                    pythoshop_colorspace.from_planes(image, planes, space)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_bad_arguments(self):
+        image = random_image(5, 4, seed=1)
+        hues, saturations, values = pythoshop_colorspace.to_planes(image)
+        with self.assertRaises(ValueError):
+            pythoshop_colorspace.from_planes(image, (hues[:-1], saturations, values))
+        with self.assertRaises(ValueError):
+            pythoshop_colorspace.to_planes(image, "cmyk")
+
+
+class TestAdjustColors(unittest.TestCase):
+    def test_adjust_colors(self):
+        for space, (from_rgb, to_rgb) in SPACES.items():
+            for hue_shift, saturation_scale, value_scale in [(0.25, 1, 1), (0, 1.5, 0.8), (0.9, 0.5, 2)]:
+                for width, height in SIZES:
+                    with self.subTest(space=space, adjustment=(hue_shift, saturation_scale, value_scale), size=(width, height)):
+                        image = random_image(width, height, seed=width)
+                        expected = copy_image(image)
+                        for x in range(width):
+                            for y in range(height):
+                                r, g, b = get_pixel_rgb(image, (x, y))
+                                h, s, v = from_rgb(r / 255, g / 255, b / 255)
+                                r, g, b = to_rgb((h + hue_shift) % 1.0, min(s * saturation_scale, 1.0), min(v * value_scale, 1.0))
+                                set_pixel_rgb(expected, (x, y), (_to_byte(r), _to_byte(g), _to_byte(b)))
+
+                        planes = pythoshop_colorspace.adjust_planes(pythoshop_colorspace.to_planes(image, space), hue_shift, saturation_scale, value_scale)
+                        pythoshop_colorspace.adjust_colors(image, hue_shift, saturation_scale, value_scale, space)
+                        self.assertEqual(image.getvalue(), expected.getvalue())
+
+                        # the same thing done with planes
+                        from_planes = random_image(width, height, seed=width + 1)
+                        pythoshop_colorspace.from_planes(from_planes, planes, space)
+                        self.assertEqual(from_planes.getvalue(), expected.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
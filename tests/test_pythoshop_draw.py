@@ -0,0 +1,130 @@
+"""
+Regression tests for pythoshop_draw: drawing with spans must change an
+image exactly like setting the same pixels one at a time would
+"""
+
+import unittest
+
+import pythoshop_draw
+import pythoshop_exports
+from pythoshop_exports import get_height, get_width, set_pixel_rgb
+from tests.images import SIZES, copy_image, random_image
+
+COLOR = (12, 200, 77)
+
+
+def _set_pixels(image, pixels, color=COLOR) -> None:
+    """
+    Set pixels one at a time, skipping any that are outside of the image
+    """
+    width, height = get_width(image), get_height(image)
+    for x, y in pixels:
+        if 0 <= x < width and 0 <= y < height:
+            set_pixel_rgb(image, (x, y), color)
+
+
+def _span_pixels(spans) -> set:
+    return {(x, y) for y, x_start, x_stop in spans for x in range(x_start, x_stop)}
+
+
+class TestFillSpans(unittest.TestCase):
+    def test_clipped_to_the_image(self):
+        spans = [(0, 0, 2), (1, -3, 2), (2, 3, 100), (-1, 0, 5), (50, 0, 5), (3, -10, 100), (1, 4, 4), (2, 5, 1)]
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                expected = copy_image(image)
+                _set_pixels(expected, _span_pixels(spans))
+                pythoshop_draw.fill_spans(image, spans, COLOR)
+                self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_counted_for_the_running_job(self):
+        image = random_image(5, 4, seed=1)
+        job = pythoshop_exports.Job(20)
+        with pythoshop_exports.running_job(job):
+            pythoshop_draw.fill_spans(image, [(0, 0, 5), (1, 3, 10), (9, 0, 5)], COLOR)
+        self.assertEqual(job.pixels_written, 7)
+        job.cancel()
+        with self.assertRaises(pythoshop_exports.JobCancelled):
+            with pythoshop_exports.running_job(job):
+                pythoshop_draw.fill_spans(image, [(0, 0, 5)], COLOR)
+
+
+class TestLineSpans(unittest.TestCase):
+    ENDS = [((0, 0), (9, 3)), ((9, 3), (0, 0)), ((2, 8), (4, 0)), ((0, 5), (7, 5)), ((3, 1), (3, 6)), ((1, 1), (6, 6)), ((5, 2), (5, 2)), ((8, 0), (0, 7))]
+
+    def test_one_pixel_per_step_on_the_line(self):
+        for start, end in self.ENDS:
+            with self.subTest(start=start, end=end):
+                pixels = _span_pixels(pythoshop_draw.line_spans(start, end))
+                self.assertIn(start, pixels)
+                self.assertIn(end, pixels)
+                dx, dy = end[0] - start[0], end[1] - start[1]
+                if abs(dx) >= abs(dy):
+                    # mostly horizontal: one pixel in each column, as close as possible to the real line
+                    self.assertEqual(sorted(x for x, _ in pixels), list(range(min(start[0], end[0]), max(start[0], end[0]) + 1)))
+                    for x, y in pixels:
+                        self.assertLessEqual(abs(start[1] + dy * (x - start[0]) / (dx or 1) - y), 0.5)
+                else:
+                    self.assertEqual(sorted(y for _, y in pixels), list(range(min(start[1], end[1]), max(start[1], end[1]) + 1)))
+                    for x, y in pixels:
+                        self.assertLessEqual(abs(start[0] + dx * (y - start[1]) / dy - x), 0.5)
+
+    def test_thickness(self):
+        for start, end in self.ENDS:
+            for thickness in (2, 3, 4):
+                with self.subTest(start=start, end=end, thickness=thickness):
+                    before = (thickness - 1) // 2
+                    mostly_horizontal = abs(end[0] - start[0]) >= abs(end[1] - start[1])
+                    expected = set()
+                    for x, y in _span_pixels(pythoshop_draw.line_spans(start, end)):
+                        for offset in range(-before, thickness - before):
+                            expected.add((x, y + offset) if mostly_horizontal else (x + offset, y))
+                    self.assertEqual(_span_pixels(pythoshop_draw.line_spans(start, end, thickness)), expected)
+
+
+class TestDraw(unittest.TestCase):
+    def test_draw_line(self):
+        # includes thick sloping lines and lines that go outside of the image
+        for start, end, thickness in [((0, 0), (6, 4), 1), ((-3, -2), (9, 7), 3), ((1, 10), (5, -4), 2), ((-5, 1), (20, 2), 4)]:
+            for width, height in SIZES:
+                with self.subTest(start=start, end=end, thickness=thickness, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    expected = copy_image(image)
+                    _set_pixels(expected, _span_pixels(pythoshop_draw.line_spans(start, end, thickness)))
+                    pythoshop_draw.draw_line(image, start, end, COLOR, thickness)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_draw_frame(self):
+        for thickness in (1, 2):
+            for width, height in SIZES:
+                with self.subTest(thickness=thickness, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    expected = copy_image(image)
+                    frame = [
+                        (x, y)
+                        for x in range(width)
+                        for y in range(height)
+                        if x < thickness or x >= width - thickness or y < thickness or y >= height - thickness
+                    ]
+                    _set_pixels(expected, frame)
+                    pythoshop_draw.draw_frame(image, COLOR, thickness)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_draw_x(self):
+        for thickness in (1, 3):
+            for width, height in SIZES:
+                with self.subTest(thickness=thickness, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    expected = copy_image(image)
+                    right, top = width - 1, height - 1
+                    cross = _span_pixels(pythoshop_draw.line_spans((0, 0), (right, top), thickness))
+                    cross |= _span_pixels(pythoshop_draw.line_spans((0, top), (right, 0), thickness))
+                    self.assertLessEqual({(0, 0), (right, top), (0, top), (right, 0)}, cross)
+                    _set_pixels(expected, cross)
+                    pythoshop_draw.draw_x(image, COLOR, thickness)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,180 @@
+"""
+Regression tests for the fast helpers in pythoshop_exports: each one must
+change an image exactly like the equivalent get_pixel_rgb/set_pixel_rgb loop
+"""
+
+import os
+import tempfile
+import unittest
+
+import pythoshop_exports
+from pythoshop_exports import create_bmp, get_height, get_pixel_rgb, get_width, set_pixel_rgb
+from tests.images import SIZES, copy_image, random_image
+
+
+class TestWriteBack(unittest.TestCase):
+    def test_apply_channel_luts(self):
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                expected = copy_image(image)
+                for x in range(width):
+                    for y in range(height):
+                        r, g, b = get_pixel_rgb(expected, (x, y))
+                        set_pixel_rgb(expected, (x, y), (255 - r, g, b // 2))
+                pythoshop_exports.apply_channel_luts(image, lambda r: 255 - r, None, [b // 2 for b in range(256)])
+                self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_set_row(self):
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                expected = copy_image(image)
+                for y in range(height):
+                    row = pythoshop_exports.get_row(image, y)
+                    self.assertEqual(row, [get_pixel_rgb(expected, (x, y)) for x in range(width)])
+                    new_row = [(g, b, r) for r, g, b in row]
+                    pythoshop_exports.set_row(image, y, new_row)
+                    for x, color in enumerate(new_row):
+                        set_pixel_rgb(expected, (x, y), color)
+                self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_pixel_buffer(self):
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                expected = copy_image(image)
+                changed = [(x, y) for x in range(width) for y in range(height) if (x + y) % 3 == 0]
+                with pythoshop_exports.PixelBuffer(image) as pixels:
+                    for x, y in changed:
+                        r, g, b = pixels[x, y]
+                        pixels[x, y] = (255 - r, 255 - g, 255 - b)
+                for x, y in changed:
+                    r, g, b = get_pixel_rgb(expected, (x, y))
+                    set_pixel_rgb(expected, (x, y), (255 - r, 255 - g, 255 - b))
+                self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_blend_images(self):
+        image = random_image(7, 5, seed=1)
+        other = random_image(5, 4, seed=2)
+        for weight in (0, 0.3, 0.5, 1):
+            for offset in ((0, 0), (3, 2), (-2, -1)):
+                with self.subTest(weight=weight, offset=offset):
+                    expected = copy_image(image)
+                    for x in range(get_width(other)):
+                        for y in range(get_height(other)):
+                            if 0 <= x + offset[0] < 7 and 0 <= y + offset[1] < 5:
+                                bottom = get_pixel_rgb(image, (x + offset[0], y + offset[1]))
+                                top = get_pixel_rgb(other, (x, y))
+                                mixed = tuple(int(a * (1 - weight) + b * weight + 0.5) for a, b in zip(bottom, top))
+                                set_pixel_rgb(expected, (x + offset[0], y + offset[1]), mixed)
+                    result = pythoshop_exports.blend_images(image, other, weight, offset)
+                    self.assertEqual(result.getvalue(), expected.getvalue())
+
+    def test_chroma_overlay(self):
+        image = random_image(7, 5, seed=3)
+        other = random_image(5, 4, seed=4)
+        key_color = get_pixel_rgb(other, (1, 1))
+        set_pixel_rgb(other, (2, 2), key_color)
+        for tolerance in (0, 100):
+            for offset in ((0, 0), (3, 2), (-2, -1)):
+                with self.subTest(tolerance=tolerance, offset=offset):
+                    expected = copy_image(image)
+                    for x in range(get_width(other)):
+                        for y in range(get_height(other)):
+                            top = get_pixel_rgb(other, (x, y))
+                            distance = sum((a - b) ** 2 for a, b in zip(top, key_color)) ** 0.5
+                            if 0 <= x + offset[0] < 7 and 0 <= y + offset[1] < 5 and distance > tolerance:
+                                set_pixel_rgb(expected, (x + offset[0], y + offset[1]), top)
+                    result = pythoshop_exports.chroma_overlay(image, other, key_color, tolerance, offset)
+                    self.assertEqual(result.getvalue(), expected.getvalue())
+
+
+class TestHeader(unittest.TestCase):
+    def test_header_bytes_written_directly(self):
+        image = create_bmp(10, 4)
+        self.assertEqual(get_width(image), 10)
+        image.seek(18)
+        image.write((5).to_bytes(4, "little"))
+        self.assertEqual(get_width(image), 5)
+        image.seek(22)
+        image.write((2).to_bytes(4, "little"))
+        self.assertEqual(get_height(image), 2)
+
+    def test_header_read_keeps_position(self):
+        image = create_bmp(10, 4)
+        image.seek(140)
+        get_width(image)
+        self.assertEqual(image.tell(), 140)
+
+
+class TestStats(unittest.TestCase):
+    def test_stats_after_writes(self):
+        image = create_bmp(5, 4)
+        self.assertEqual(pythoshop_exports.stats(image).maximum, (0, 0, 0))
+        set_pixel_rgb(image, (1, 1), (10, 0, 0))
+        self.assertEqual(pythoshop_exports.stats(image).maximum, (10, 0, 0))
+        pythoshop_exports.set_row(image, 2, [(0, 20, 0)] * 5)
+        self.assertEqual(pythoshop_exports.stats(image).maximum, (10, 20, 0))
+        with pythoshop_exports.PixelBuffer(image) as pixels:
+            pixels[4, 3] = (0, 0, 30)
+        self.assertEqual(pythoshop_exports.stats(image).maximum, (10, 20, 30))
+        pythoshop_exports.apply_channel_luts(image, lambda r: 255 - r)
+        self.assertEqual(pythoshop_exports.stats(image).minimum, (245, 0, 0))
+
+
+class TestWatchWrites(unittest.TestCase):
+    def test_rows_written_by_helpers(self):
+        image = random_image(5, 6, seed=5)
+        original = image.getvalue()
+        row_size = 16
+        with pythoshop_exports.watch_writes(image) as written:
+            set_pixel_rgb(image, (1, 1), (1, 2, 3))
+            pythoshop_exports.set_row(image, 3, [(0, 0, 0)] * 5)
+            self.assertEqual(written.take_span(), (1, 3))
+            self.assertIsNone(written.take_span())
+            with pythoshop_exports.PixelBuffer(image) as pixels:
+                pixels[0, 5] = (9, 9, 9)
+            set_pixel_rgb(image, (2, 1), (4, 5, 6))
+            self.assertEqual(written.take_span(), (1, 5))
+        self.assertEqual(sorted(written.before), [1, 3, 5])
+        for y, before in written.before.items():
+            self.assertEqual(before, original[138 + row_size * y : 138 + row_size * (y + 1)])
+
+        set_pixel_rgb(image, (0, 0), (1, 1, 1))  # no longer watched
+        self.assertIsNone(written.take_span())
+        self.assertNotIn(0, written.before)
+
+
+class TestMappedBmp(unittest.TestCase):
+    def test_copy_keeps_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "image.bmp")
+            with open(file_name, "wb") as file:
+                file.write(random_image(300, 200, seed=6).getvalue())
+            image = pythoshop_exports.MappedBmp(file_name)
+            set_pixel_rgb(image, (1, 1), (1, 2, 3))
+            set_pixel_rgb(image, (299, 199), (4, 5, 6))
+            copy = image.copy()
+            self.assertEqual(copy.getvalue(), image.getvalue())
+            set_pixel_rgb(copy, (2, 2), (7, 8, 9))
+            self.assertNotEqual(get_pixel_rgb(image, (2, 2)), (7, 8, 9))
+            image.close()
+            copy.close()
+
+
+class TestJobCancelled(unittest.TestCase):
+    def test_not_caught_by_except_exception(self):
+        image = create_bmp(4, 4)
+        job = pythoshop_exports.Job(16)
+        job.cancel()
+        with self.assertRaises(pythoshop_exports.JobCancelled):
+            with pythoshop_exports.running_job(job):
+                try:
+                    set_pixel_rgb(image, (0, 0), (1, 1, 1))
+                except Exception:
+                    pass
+
+
+if __name__ == "__main__":
+    unittest.main()
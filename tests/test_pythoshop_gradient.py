@@ -0,0 +1,38 @@
+"""
+Regression tests for pythoshop_gradient: fades must change an image exactly
+like mixing one pixel at a time would
+"""
+
+import unittest
+
+import pythoshop_gradient
+from pythoshop_exports import get_pixel_rgb, set_pixel_rgb
+from tests.images import copy_image, random_image
+
+
+class TestFade(unittest.TestCase):
+    def test_same_as_pixel_loop(self):
+        color = (238, 0, 119)
+        for width, height in [(4, 3), (5, 6), (7, 1)]:
+            for vertical in (True, False):
+                for fade_in in (True, False):
+                    for profile in (pythoshop_gradient.linear, pythoshop_gradient.ease_in, pythoshop_gradient.ease_out):
+                        with self.subTest(size=(width, height), vertical=vertical, fade_in=fade_in, profile=profile.__name__):
+                            image = random_image(width, height, seed=width * height)
+                            expected = copy_image(image)
+                            for x in range(width):
+                                for y in range(height):
+                                    # how far along the fade: top to bottom (y = 0 is the bottom row) or left to right
+                                    along = (height - 1 - y) / max(height - 1, 1) if vertical else x / max(width - 1, 1)
+                                    weight = profile(along)
+                                    if fade_in:
+                                        weight = 1 - weight
+                                    old = get_pixel_rgb(image, (x, y))
+                                    set_pixel_rgb(expected, (x, y), tuple(int(v * (1 - weight) + c * weight + 0.5) for v, c in zip(old, color)))
+
+                            pythoshop_gradient.fade(image, color, vertical=vertical, fade_in=fade_in, profile=profile)
+                            self.assertEqual(image.getvalue(), expected.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+"""
+Regression tests for pythoshop_history: applying a change must give back
+exactly the other version of an image, whichever way round and however
+many times it is applied
+"""
+
+import io
+import unittest
+
+import pythoshop_history
+import pythoshop_transform
+from pythoshop_exports import get_pixel_rgb, set_pixel_rgb, set_row, watch_writes
+from tests.images import SIZES, copy_image, random_image
+
+
+def _changed(image, pixels):
+    changed = copy_image(image)
+    for x, y in pixels:
+        set_pixel_rgb(changed, (x, y), (1, 2, 3))
+    return changed
+
+
+class TestDiff(unittest.TestCase):
+    def test_round_trip(self):
+        for pixels in ([(0, 0)], [(1, 0), (2, 1)], [(0, 0), (3, 1)], [(x, y) for x in range(4) for y in range(2)]):
+            for width, height in SIZES:
+                with self.subTest(pixels=pixels, size=(width, height)):
+                    before = random_image(width, height, seed=width)
+                    after = _changed(before, pixels)
+                    change = pythoshop_history.diff(before.getvalue(), after.getvalue())
+                    self.assertIsNone(change.snapshot)
+                    self.assertLessEqual(change.size, (width * 3 + 3) // 4 * 4 * len({y for _, y in pixels}))
+                    image = copy_image(after)
+                    for expected in (before, after, before):
+                        self.assertIs(change.apply(image), image)
+                        self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_next_to_each_other_rows_are_one_run(self):
+        before = random_image(5, 6, seed=1)
+        after = _changed(before, [(0, 1), (0, 2), (0, 4)])
+        change = pythoshop_history.diff(before.getvalue(), after.getvalue())
+        self.assertEqual([(start, len(data)) for start, data in change.runs], [(138 + 16, 32), (138 + 16 * 4, 16)])
+
+    def test_nothing_changed(self):
+        image = random_image(5, 4, seed=1)
+        self.assertIsNone(pythoshop_history.diff(image.getvalue(), image.getvalue()))
+
+    def test_size_changed(self):
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                before = random_image(width, height, seed=width)
+                after = pythoshop_transform.shrink(before)
+                change = pythoshop_history.diff(before.getvalue(), after.getvalue())
+                self.assertEqual(change.snapshot, before.getvalue())
+                undone = change.apply(copy_image(after))
+                self.assertEqual(undone.getvalue(), before.getvalue())
+                redone = change.apply(undone)
+                self.assertEqual(redone.getvalue(), after.getvalue())
+
+    def test_diff_rows(self):
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                before = random_image(width, height, seed=width)
+                image = copy_image(before)
+                with watch_writes(image) as written:
+                    set_pixel_rgb(image, (0, 0), (1, 2, 3))
+                    set_row(image, 1, [(4, 5, 6)] * width)
+                    set_pixel_rgb(image, (2, height - 1), (7, 8, 9))
+                    set_pixel_rgb(image, (2, height - 1), get_pixel_rgb(before, (2, height - 1)))  # written but not changed
+                change = pythoshop_history.diff_rows(image, written.before)
+                self.assertEqual(change.runs, pythoshop_history.diff(before.getvalue(), image.getvalue()).runs)
+                change.apply(image)
+                self.assertEqual(image.getvalue(), before.getvalue())
+
+
+class TestHistory(unittest.TestCase):
+    def test_undo_and_redo(self):
+        history = pythoshop_history.History()
+        versions = [random_image(5, 4, seed=1)]
+        versions.append(_changed(versions[-1], [(0, 0)]))
+        versions.append(pythoshop_transform.enlarge(versions[-1]))
+        versions.append(_changed(versions[-1], [(9, 7), (0, 3)]))
+        for before, after in zip(versions, versions[1:]):
+            history.record(before.getvalue(), after.getvalue())
+
+        image = copy_image(versions[-1])
+        for expected in reversed(versions[:-1]):
+            self.assertTrue(history.can_undo())
+            image = history.undo(image)
+            self.assertEqual(image.getvalue(), expected.getvalue())
+        self.assertFalse(history.can_undo())
+        for expected in versions[1:]:
+            self.assertTrue(history.can_redo())
+            image = history.redo(image)
+            self.assertEqual(image.getvalue(), expected.getvalue())
+        self.assertFalse(history.can_redo())
+        self.assertEqual(history.size, sum(change.size for change in history.undo_changes))
+
+    def test_new_change_forgets_redo(self):
+        history = pythoshop_history.History()
+        before = random_image(5, 4, seed=1)
+        after = _changed(before, [(0, 0)])
+        history.record(before.getvalue(), after.getvalue())
+        history.undo(io.BytesIO(after.getvalue()))
+        history.record(before.getvalue(), _changed(before, [(1, 3)]).getvalue())
+        self.assertFalse(history.can_redo())
+        self.assertEqual(len(history.undo_changes), 1)
+        self.assertEqual(history.size, 16)
+
+    def test_budget_forgets_oldest_changes(self):
+        history = pythoshop_history.History(budget_bytes=16 * 2)  # two rows of a 5 pixel wide image
+        image = random_image(5, 4, seed=1)
+        changes = []
+        for y in range(4):
+            changed = _changed(image, [(0, y)])
+            changes.append(pythoshop_history.diff(image.getvalue(), changed.getvalue()))
+            history.add(changes[-1])
+            image = changed
+            self.assertLessEqual(history.size, history.budget_bytes)
+        self.assertEqual(list(history.undo_changes), changes[2:])
+        self.assertEqual(history.size, 32)
+
+        history.add(pythoshop_history.Change(snapshot=bytes(100)))  # bigger than the whole budget
+        self.assertFalse(history.can_undo())
+        self.assertEqual(history.size, 0)
+        history.add(None)
+        self.assertFalse(history.can_undo())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Regression tests for pythoshop_neighborhood: the row-at-a-time filters must
+make the same image as working out each pixel from its neighbors one at a
+time with get_pixel_rgb/set_pixel_rgb
+"""
+
+import unittest
+
+import pythoshop_neighborhood
+from pythoshop_exports import get_pixel_rgb, set_pixel_rgb
+from tests.images import SIZES, copy_image, random_image
+
+
+def _clamp(value, low, high):
+    return max(low, min(high, value))
+
+
+def _convolve_pixels(image, width, height, kernel_x, kernel_y):
+    """
+    Convolve an image one pixel at a time (rows first, then columns), with copies of the edge pixels past the edges
+    """
+    radius_x, radius_y = len(kernel_x) // 2, len(kernel_y) // 2
+    across = {}
+    for x in range(width):
+        for y in range(height):
+            colors = [get_pixel_rgb(image, (_clamp(x + tap - radius_x, 0, width - 1), y)) for tap in range(len(kernel_x))]
+            across[x, y] = [sum(weight * color[channel] for weight, color in zip(kernel_x, colors)) for channel in range(3)]
+    for x in range(width):
+        for y in range(height):
+            values = [across[x, _clamp(y + tap - radius_y, 0, height - 1)] for tap in range(len(kernel_y))]
+            totals = [sum(weight * value[channel] for weight, value in zip(kernel_y, values)) for channel in range(3)]
+            set_pixel_rgb(image, (x, y), tuple(_clamp(int(total + 0.5), 0, 255) for total in totals))
+
+
+class TestConvolution(unittest.TestCase):
+    def test_convolve_separable(self):
+        kernels = [([0.25, 0.5, 0.25], None), ([1], [0.2] * 5), ([-1, 3, -1], [0.5, 0, 0.5]), (pythoshop_neighborhood.box_kernel(2), None)]
+        for kernel_x, kernel_y in kernels:
+            for width, height in SIZES:
+                with self.subTest(kernel_x=kernel_x, kernel_y=kernel_y, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    expected = copy_image(image)
+                    _convolve_pixels(expected, width, height, kernel_x, kernel_x if kernel_y is None else kernel_y)
+                    pythoshop_neighborhood.convolve_separable(image, kernel_x, kernel_y)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_even_kernel(self):
+        with self.assertRaises(ValueError):
+            pythoshop_neighborhood.convolve_separable(random_image(4, 3, seed=1), [0.5, 0.5])
+
+    def test_box_blur(self):
+        for radius in (0, 1, 2, 10):
+            for width, height in SIZES:
+                with self.subTest(radius=radius, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    expected = copy_image(image)
+                    for x in range(width):
+                        for y in range(height):
+                            square = [
+                                get_pixel_rgb(image, (nx, ny))
+                                for nx in range(max(0, x - radius), min(width, x + radius + 1))
+                                for ny in range(max(0, y - radius), min(height, y + radius + 1))
+                            ]
+                            average = tuple(int(sum(color[channel] for color in square) / len(square) + 0.5) for channel in range(3))
+                            set_pixel_rgb(expected, (x, y), average)
+                    pythoshop_neighborhood.box_blur(image, radius)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+
+class TestEdgeMap(unittest.TestCase):
+    EDGE, BACKGROUND = (1, 2, 3), (250, 251, 252)
+
+    def test_edge_map(self):
+        for tolerance in (0, 20, 60):
+            for keep_border in (True, False):
+                for width, height in SIZES:
+                    with self.subTest(tolerance=tolerance, keep_border=keep_border, size=(width, height)):
+                        image = random_image(width, height, seed=width)
+                        set_pixel_rgb(image, (0, 0), (20, 20, 20))
+                        set_pixel_rgb(image, (1, 0), (40, 40, 40))  # exactly `tolerance` brighter when it is 20: not an edge
+                        set_pixel_rgb(image, (0, 1), (20, 20, 20))
+                        expected = copy_image(image)
+                        for x in range(width):
+                            for y in range(height):
+                                if keep_border and (x == width - 1 or y == height - 1):
+                                    continue
+                                brightness = sum(get_pixel_rgb(image, (x, y))) / 3
+                                edge = False
+                                if x + 1 < width:
+                                    edge = edge or abs(brightness - sum(get_pixel_rgb(image, (x + 1, y))) / 3) > tolerance
+                                if y + 1 < height:
+                                    edge = edge or abs(brightness - sum(get_pixel_rgb(image, (x, y + 1))) / 3) > tolerance
+                                set_pixel_rgb(expected, (x, y), self.EDGE if edge else self.BACKGROUND)
+                        pythoshop_neighborhood.edge_map(image, tolerance, self.EDGE, self.BACKGROUND, keep_border=keep_border)
+                        self.assertEqual(image.getvalue(), expected.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Regression tests for pythoshop_noise: the random values must be exactly the
+ones random.randint would give, and use up the same random numbers
+"""
+
+import random
+import unittest
+
+import pythoshop_noise
+from pythoshop_exports import create_bmp, set_pixel_rgb
+
+
+class TestRandintBytes(unittest.TestCase):
+    def test_matches_randint(self):
+        for low, high in [(0, 255), (0, 1), (5, 5), (10, 20), (0, 127), (100, 228), (3, 255)]:
+            with self.subTest(low=low, high=high):
+                expected_rng = random.Random(0)
+                rng = random.Random(0)
+                expected = bytes(expected_rng.randint(low, high) for _ in range(5000))
+                self.assertEqual(pythoshop_noise.randint_bytes(5000, low, high, rng), expected)
+                self.assertEqual(rng.getstate(), expected_rng.getstate())
+
+    def test_randbytes_range(self):
+        values = pythoshop_noise.randbytes(5000, 10, 20, random.Random(0))
+        self.assertEqual(len(values), 5000)
+        self.assertTrue(all(10 <= value <= 20 for value in values))
+
+
+class TestStatic(unittest.TestCase):
+    def test_same_as_randint_loop(self):
+        for width, height in [(4, 3), (5, 4), (7, 2)]:
+            for order in ("xy", "yx"):
+                with self.subTest(size=(width, height), order=order):
+                    expected = create_bmp(width, height)
+                    random.seed(0)
+                    coordinates = [(x, y) for x in range(width) for y in range(height)]
+                    if order == "yx":
+                        coordinates.sort(key=lambda x_y: (x_y[1], x_y[0]))
+                    for x, y in coordinates:
+                        set_pixel_rgb(expected, (x, y), (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)))
+
+                    image = create_bmp(width, height)
+                    random.seed(0)
+                    pythoshop_noise.static(image, order=order)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_with_color(self):
+        color = (200, 100, 7)
+        expected = create_bmp(5, 3)
+        random.seed(1)
+        for x in range(5):
+            for y in range(3):
+                brightness = random.randint(0, 255)
+                set_pixel_rgb(expected, (x, y), tuple(int(value * brightness / 255 + 0.5) for value in color))
+
+        image = create_bmp(5, 3)
+        random.seed(1)
+        pythoshop_noise.static(image, color)
+        self.assertEqual(image.getvalue(), expected.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Regression tests for pythoshop_parallel: running a filter on bands of rows
+in other processes must change an image exactly like running it on the
+whole image would
+"""
+
+import unittest
+from unittest import mock
+
+import pythoshop_exports
+import pythoshop_parallel
+from pythoshop_exports import get_pixel_rgb, set_pixel_rgb
+from tests.images import SIZES, copy_image, random_image
+
+
+# The filters are loaded from this file by the worker processes
+
+
+def negate_red(image):
+    pythoshop_exports.apply_channel_luts(image, lambda r: 255 - r)
+
+
+def copy_other(image, other_image):
+    for x in range(pythoshop_exports.get_width(image)):
+        for y in range(pythoshop_exports.get_height(image)):
+            set_pixel_rgb(image, (x, y), get_pixel_rgb(other_image, (x, y)))
+
+
+def make_new_image(image):
+    return pythoshop_exports.create_bmp(1, 1)
+
+
+class TestRunInBands(unittest.TestCase):
+    def setUp(self):
+        # Every image is big enough to be split into (up to) 4 bands
+        patchers = [mock.patch.object(pythoshop_parallel, "PARALLEL_MIN_PIXELS", 1), mock.patch.object(pythoshop_parallel.os, "cpu_count", return_value=4)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.stop_executor)
+
+    def stop_executor(self):
+        if pythoshop_parallel._executor is not None:
+            pythoshop_parallel._executor.shutdown()
+            pythoshop_parallel._executor = None
+
+    def test_bands(self):
+        for width, height in SIZES + [(9, 11)]:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                expected = copy_image(image)
+                for x in range(width):
+                    for y in range(height):
+                        r, g, b = get_pixel_rgb(expected, (x, y))
+                        set_pixel_rgb(expected, (x, y), (255 - r, g, b))
+                job = pythoshop_exports.Job(width * height)
+                with pythoshop_exports.watch_writes(image) as written, pythoshop_exports.running_job(job):
+                    self.assertIsNone(pythoshop_parallel.run_in_bands(negate_red, image))
+                self.assertEqual(image.getvalue(), expected.getvalue())
+                self.assertEqual(written.take_span(), (0, height - 1))
+                self.assertEqual(job.progress(), 1.0)
+                self.assertIsNotNone(pythoshop_parallel._executor)  # it really was run in other processes
+
+    def test_secondary_image_runs_normally(self):
+        image = random_image(5, 4, seed=1)
+        other_image = random_image(5, 4, seed=2)
+        pythoshop_parallel.run_in_bands(copy_other, image, other_image=other_image)
+        self.assertEqual(image.getvalue(), other_image.getvalue())
+        self.assertIsNone(pythoshop_parallel._executor)
+
+    def test_new_image_not_allowed(self):
+        with self.assertRaises(Exception):
+            pythoshop_parallel.run_in_bands(make_new_image, random_image(5, 4, seed=1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Regression tests for pythoshop_quantize: the tone filters must pick the same
+palette color for every pixel as a get_pixel_rgb/set_pixel_rgb loop would,
+including pixels that are exactly on a threshold or exactly between colors
+"""
+
+import unittest
+
+import pythoshop_quantize
+from pythoshop_exports import get_pixel_rgb, set_pixel_rgb
+from tests.images import SIZES, copy_image, random_image
+
+PALETTE = [(0, 0, 0), (255, 0, 0), (0, 255, 0), (0, 0, 255)]
+
+
+class TestThresholdTones(unittest.TestCase):
+    def check(self, image, width, height, thresholds, palette, filter_function):
+        expected = copy_image(image)
+        for x in range(width):
+            for y in range(height):
+                brightness = sum(get_pixel_rgb(image, (x, y))) / 3
+                set_pixel_rgb(expected, (x, y), palette[sum(1 for threshold in thresholds if brightness >= threshold)])
+        filter_function(image)
+        self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_threshold_tones(self):
+        thresholds = [20, 100.5, 200]
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                set_pixel_rgb(image, (0, 0), (20, 20, 20))  # exactly thresholds[0]: the second tone
+                set_pixel_rgb(image, (1, 0), (19, 20, 20))  # just darker: the first tone
+                set_pixel_rgb(image, (2, 0), (100, 101, 100))  # brightness 100.33: still the second tone
+                set_pixel_rgb(image, (0, 1), (100, 101, 101))  # brightness 100.67: the third tone
+                set_pixel_rgb(image, (1, 1), (255, 255, 90))  # exactly thresholds[2]: the last tone
+                self.check(image, width, height, thresholds, PALETTE, lambda image: pythoshop_quantize.threshold_tones(image, thresholds, PALETTE))
+                for x, y, tone in [(0, 0, 1), (1, 0, 0), (2, 0, 1), (0, 1, 2), (1, 1, 3)]:
+                    self.assertEqual(get_pixel_rgb(image, (x, y)), PALETTE[tone])
+
+    def test_n_tones(self):
+        # even_thresholds(3) are 256/3 and 512/3, which r + g + b totals of 256 and 512 hit exactly
+        thresholds = pythoshop_quantize.even_thresholds(3)
+        for width, height in SIZES:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                set_pixel_rgb(image, (0, 0), (86, 85, 85))
+                set_pixel_rgb(image, (1, 0), (85, 85, 85))
+                set_pixel_rgb(image, (0, 1), (171, 171, 170))
+                self.check(image, width, height, thresholds, PALETTE[:3], lambda image: pythoshop_quantize.n_tones(image, PALETTE[:3]))
+                for x, y, tone in [(0, 0, 1), (1, 0, 0), (0, 1, 2)]:
+                    self.assertEqual(get_pixel_rgb(image, (x, y)), PALETTE[tone])
+
+    def test_bad_arguments(self):
+        image = random_image(4, 3, seed=1)
+        with self.assertRaises(ValueError):
+            pythoshop_quantize.threshold_tones(image, [100], PALETTE)
+        with self.assertRaises(ValueError):
+            pythoshop_quantize.threshold_tones(image, [200, 100, 50], PALETTE)
+        with self.assertRaises(ValueError):
+            pythoshop_quantize.even_thresholds(0)
+
+
+class TestNearestTones(unittest.TestCase):
+    def test_nearest_tones(self):
+        palettes = [PALETTE, [(0, 10, 10), (20, 10, 10), (10, 10, 10)], [(20, 10, 10), (0, 10, 10)], [(128, 128, 128), (128, 128, 128), (0, 0, 0)]]
+        for palette in palettes:
+            for width, height in SIZES:
+                with self.subTest(palette=palette, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    set_pixel_rgb(image, (0, 0), (10, 10, 10))  # the same distance from (0, 10, 10) and (20, 10, 10)
+                    set_pixel_rgb(image, (1, 0), (64, 64, 64))  # the same distance from (128, 128, 128) and (0, 0, 0)
+                    expected = copy_image(image)
+                    for x in range(width):
+                        for y in range(height):
+                            color = get_pixel_rgb(image, (x, y))
+                            distances = [sum((a - b) ** 2 for a, b in zip(color, option)) for option in palette]
+                            set_pixel_rgb(expected, (x, y), palette[distances.index(min(distances))])  # the first of any ties
+                    pythoshop_quantize.nearest_tones(image, palette)
+                    self.assertEqual(image.getvalue(), expected.getvalue())
+
+    def test_ties_pick_the_first_color(self):
+        self.assertEqual(pythoshop_quantize.nearest_palette_index((10, 10, 10), ((0, 10, 10), (20, 10, 10))), 0)
+        self.assertEqual(pythoshop_quantize.nearest_palette_index((10, 10, 10), ((20, 10, 10), (0, 10, 10))), 0)
+        self.assertEqual(pythoshop_quantize.nearest_palette_index((64, 64, 64), ((128, 128, 128), (0, 0, 0))), 0)
+        self.assertEqual(pythoshop_quantize.nearest_palette_index((64, 64, 64), ((0, 0, 0), (128, 128, 128))), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Regression tests for pythoshop_transform: every transform must make the same
+image as copying the pixels one at a time with get_pixel_rgb/set_pixel_rgb
+"""
+
+import unittest
+
+import pythoshop_transform
+from pythoshop_exports import create_bmp, get_height, get_pixel_rgb, get_width, set_pixel_rgb
+from tests.images import SIZES, random_image
+
+# Where each pixel of the new image comes from: (x, y, width, height) -> (x, y) in the original (y = 0 is the bottom row)
+TRANSFORMS = {
+    "flip_horizontal": lambda x, y, width, height: (width - 1 - x, y),
+    "flip_vertical": lambda x, y, width, height: (x, height - 1 - y),
+    "rotate_180": lambda x, y, width, height: (width - 1 - x, height - 1 - y),
+    "mirror_horizontal_left": lambda x, y, width, height: (x if x < width / 2 else width - 1 - x, y),
+    "mirror_horizontal_right": lambda x, y, width, height: (x if x >= width / 2 else width - 1 - x, y),
+    "mirror_vertical_top": lambda x, y, width, height: (x, y if y >= height / 2 else height - 1 - y),
+    "mirror_vertical_bottom": lambda x, y, width, height: (x, y if y < height / 2 else height - 1 - y),
+}
+
+
+def _copy_pixels(image, width, height, source_of):
+    """
+    Build a new image one pixel at a time, taking each pixel from source_of(x, y)
+    """
+    result = create_bmp(width, height)
+    for x in range(width):
+        for y in range(height):
+            set_pixel_rgb(result, (x, y), get_pixel_rgb(image, source_of(x, y)))
+    return result
+
+
+class TestTransforms(unittest.TestCase):
+    def assertSameImage(self, result, expected):
+        width, height = get_width(expected), get_height(expected)
+        self.assertEqual((get_width(result), get_height(result)), (width, height))
+        data = result.getvalue()
+        self.assertEqual(data[:138], create_bmp(width, height).getvalue()[:138])
+        row_size = (width * 3 + 3) // 4 * 4
+        for y in range(height):
+            self.assertEqual(data[138 + row_size * y + width * 3 : 138 + row_size * (y + 1)], bytes(row_size - width * 3))
+        self.assertEqual(data, expected.getvalue())
+
+    def test_same_size_transforms(self):
+        for operation, source_of in TRANSFORMS.items():
+            for width, height in SIZES:
+                with self.subTest(operation=operation, size=(width, height)):
+                    image = random_image(width, height, seed=width)
+                    expected = _copy_pixels(image, width, height, lambda x, y: source_of(x, y, width, height))
+                    self.assertSameImage(pythoshop_transform.apply_transform(image, operation), expected)
+                    self.assertSameImage(pythoshop_transform.apply_transform(image, operation), expected)  # map remembered from the first call
+
+    def test_resize(self):
+        for width, height in SIZES:
+            image = random_image(width, height, seed=width)
+            for new_width, new_height in SIZES + [(1, 1), (width * 3, height), (width, 1)]:
+                with self.subTest(size=(width, height), new_size=(new_width, new_height)):
+                    expected = _copy_pixels(image, new_width, new_height, lambda x, y: (x * width // new_width, y * height // new_height))
+                    self.assertSameImage(pythoshop_transform.resize(image, new_width, new_height), expected)
+
+    def test_shrink_and_enlarge(self):
+        for width, height in SIZES + [(1, 1)]:
+            with self.subTest(size=(width, height)):
+                image = random_image(width, height, seed=width)
+                small_width, small_height = max(width // 2, 1), max(height // 2, 1)
+                expected = _copy_pixels(image, small_width, small_height, lambda x, y: (x * width // small_width, y * height // small_height))
+                self.assertSameImage(pythoshop_transform.shrink(image), expected)
+                expected = _copy_pixels(image, width * 2, height * 2, lambda x, y: (x // 2, y // 2))
+                self.assertSameImage(pythoshop_transform.enlarge(image), expected)
+
+    def test_bad_arguments(self):
+        image = random_image(4, 3, seed=1)
+        with self.assertRaises(ValueError):
+            pythoshop_transform.apply_transform(image, "spin")
+        with self.assertRaises(ValueError):
+            pythoshop_transform.resize(image, -1, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
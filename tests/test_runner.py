@@ -7,6 +7,8 @@ from io import BytesIO
 
 from PIL import Image, ImageDraw, ImageFont
 
+from pythoshop_exports import MAPPED_IMAGE_MIN_BYTES, MappedBmp
+
 
 class SideBySideImage:
     _WIDTH = 200
@@ -115,8 +117,11 @@ def _create_failure_visual(
     return combined_image
 
 
-def get_image_bytes(file_name: str) -> BytesIO:
-    if os.path.splitext(file_name)[-1].lower() == ".bmp":
+def get_image_bytes(file_name: str) -> typing.Union[BytesIO, MappedBmp]:
+    if os.path.splitext(file_name)[-1].lower() == ".bmp" and os.path.getsize(file_name) >= MAPPED_IMAGE_MIN_BYTES:
+        # Huge images are used straight from the file so they don't all have to fit in memory
+        current_bytes = MappedBmp(file_name)
+    elif os.path.splitext(file_name)[-1].lower() == ".bmp":
         # Load it directly rather than going through Pillow where we might loose some fidelity (e.g. paddding bytes)
         current_bytes = BytesIO()
         current_bytes.write(open(file_name, "rb").read())
@@ -336,7 +341,7 @@ def get_decorated_function_names(file_path: str) -> set[str]:
     return found_function_names
 
 
-def load_image(image_name: str) -> BytesIO:
+def load_image(image_name: str) -> typing.Union[BytesIO, MappedBmp]:
     image_path = os.path.join(os.path.dirname(__file__), f"../images/{image_name}")
     ret = get_image_bytes(image_path)
     ret.seek(0)
@@ -361,6 +366,8 @@ def execute_function(
     except TypeError:
         # Filter
         kwargs = {"clicked_coordinate": (20, 20), "color": filter_info.color, "other_image": image_bytes_io_secondary, "extra": filter_info.extra}
+        if getattr(function, "__batch__", False):
+            kwargs["clicked_coordinates"] = [(20, 20)]
         result = function(image_bytes_io_primary, **kwargs)
 
     if not result: